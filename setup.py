@@ -1,9 +1,17 @@
 from setuptools import setup, find_packages
 
+# Optional compiled helpers; the pure-Python fallbacks are used without Cython
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize("src/document_processing/_text_chunker_fast.pyx")
+except ImportError:
+    ext_modules = []
+
 setup(
     name="multi-model-rag-chatbot",
     version="0.1.0",
     packages=find_packages(),
+    ext_modules=ext_modules,
     install_requires=[
         "langchain",
         "faiss-cpu",
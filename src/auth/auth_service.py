@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 
 from ..utils.logger import get_logger
-from ..database.models import UserModel
+from ..core.resources import GlobalResources
 
 logger = get_logger(__name__)
 
@@ -24,7 +24,7 @@ class AuthService:
     
     def __init__(self):
         """Initialize the authentication service."""
-        self.user_model = UserModel()
+        self.user_model = GlobalResources.get_user_model()
     
     def hash_password(self, password: str) -> str:
         """
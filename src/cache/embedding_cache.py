@@ -0,0 +1,77 @@
+"""
+Persistent content-addressed cache for chunk embeddings, backed by SQLite.
+"""
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..utils.logger import get_logger
+from ..config import EMBEDDING_CACHE_PATH, VECTOR_DIMENSION
+
+logger = get_logger(__name__)
+
+class EmbeddingCache:
+    """Map blake2b(chunk text) -> float32 embedding so unchanged chunks are never re-embedded."""
+
+    # Stay under SQLITE_MAX_VARIABLE_NUMBER on older SQLite builds
+    MAX_QUERY_PARAMS = 900
+
+    def __init__(self, db_path: Path = EMBEDDING_CACHE_PATH, namespace: str = "", dimension: int = VECTOR_DIMENSION):
+        """
+        Args:
+            db_path: SQLite file holding the cache
+            namespace: Mixed into every key so different models never share vectors
+            dimension: Expected embedding size; rows of any other size are ignored
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.dimension = dimension
+        self._prefix = f"{namespace}\0".encode('utf-8') if namespace else b""
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+        self.conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.blake2b(self._prefix + text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for whichever of keys are present."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        expected_bytes = self.dimension * 4
+        with self._lock:
+            for i in range(0, len(unique_keys), self.MAX_QUERY_PARAMS):
+                chunk = unique_keys[i:i + self.MAX_QUERY_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE hash IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    if len(blob) == expected_bytes:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """Store vectors (one row per key) as raw float32 bytes."""
+        if not keys:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        rows = [(key, vectors[i].tobytes()) for i, key in enumerate(keys)]
+        try:
+            with self._lock, self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write {len(rows)} embeddings to cache: {e}")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -4,6 +4,7 @@ import time
 import asyncio
 import traceback
 from typing import List, Dict, Any
+from pathlib import Path
 from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage, AIMessage
 
@@ -147,9 +148,9 @@ class ChainBuilder:
 
             if files_info:
                 logger.debug(f"[run_chain] Processing files: {files_info}")
-                for file in files_info:
-                    path = file.get("path")
-                    if path and self.version_control.check_version(path):
+                paths = [Path(file["path"]) for file in files_info if file.get("path")]
+                for path, needs_reindex in self.version_control.check_versions_bulk(paths).items():
+                    if needs_reindex:
                         self.version_control.reindex_document(path)
                         logger.debug(f"[run_chain] Reindexed document: {path}")
 
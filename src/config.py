@@ -38,11 +38,32 @@ MAX_VECTOR_SEARCH_TOP_K = 20  # ← ADD THIS LINE
 # Model settings
 EMBEDDING_MODEL_NAME = "sentence-transformers/multi-qa-mpnet-base-dot-v1"
 LLM_MODEL_NAME = os.getenv("GROQ_MODEL", "llama3-8b-8192")  # Using Groq's Llama 3 model
+USE_INT8_EMBED = os.getenv("USE_INT8_EMBED", "false").lower() == "true"  # Dynamic INT8 quantization of the embedding model
+USE_TORCHSCRIPT_EMBED = os.getenv("USE_TORCHSCRIPT_EMBED", "true").lower() == "true"  # Trace + freeze the torch embedding model
+USE_BF16_QUERY_EMBED = os.getenv("USE_BF16_QUERY_EMBED", "false").lower() == "true"  # BF16 autocast for single-query embeddings (AVX-512 BF16/AMX CPUs); eager model only, needs USE_TORCHSCRIPT_EMBED=false
+EMBEDDING_TORCH_THREADS = int(os.getenv("EMBEDDING_TORCH_THREADS", str(min(8, os.cpu_count() or 1))))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()  # "torch" or "onnx" (INT8 ONNX Runtime)
+EMBEDDING_ONNX_DIR = MODELS_DIR / "embedding_onnx"
+EMBEDDING_CACHE_PATH = EMBEDDINGS_DIR / "cache.sqlite"  # Content-addressed chunk embedding cache
+USE_EMBEDDING_CACHE = os.getenv("USE_EMBEDDING_CACHE", "true").lower() == "true"
+NER_TRANSFORMER_MODEL = os.getenv("NER_TRANSFORMER_MODEL", "distilbert-base-uncased")  # Any HF encoder, e.g. a distilled/pruned checkpoint
+NER_TRANSFORMER_BACKEND = os.getenv("NER_TRANSFORMER_BACKEND", "torch").lower()  # "torch" or "onnx" (ONNX Runtime for the NER transformer)
+USE_INT8_NER = os.getenv("USE_INT8_NER", "false").lower() == "true"  # Dynamic INT8 quantization of the NER transformer
+NER_ONNX_THREADS = int(os.getenv("NER_ONNX_THREADS", str(min(8, os.cpu_count() or 1))))
+NER_ASYNC_WORKERS = int(os.getenv("NER_ASYNC_WORKERS", "1"))  # Threads serving EntityExtractor.aextract_entities
 
 # Vector search settings
 VECTOR_DIMENSION = 768  # Dimension of the embedding vectors
 SIMILARITY_THRESHOLD = 0.45  # Minimum similarity score for retrieval
 MAX_CONTEXT_DOCUMENTS = 5  # Maximum number of documents to include in context
+# "flat" (exact), or opt in to approximate "hnsw", "ivfpq" or "sq8"; these are
+# rebuilt (and ivfpq/sq8 retrained) from vectors.npy on every process start
+FAISS_INDEX_KIND = os.getenv("FAISS_INDEX_KIND", "flat").lower()
+FAISS_HNSW_M = 32  # Graph neighbours per node for IndexHNSWFlat
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 64
+FAISS_IVF_NLIST = 256  # Number of coarse centroids for IndexIVFPQ
+FAISS_IVF_NPROBE = 16
 
 # Conversation settings
 MAX_HISTORY_MESSAGES = 10  # Maximum number of messages to keep in conversation history
@@ -1,16 +1,52 @@
 import os
+import atexit
 import threading
 import warnings
-from typing import Optional
+from typing import Optional, Dict, Any, Callable
 
 import faiss
-from transformers import AutoModel, AutoTokenizer
+import torch
+from transformers import AutoModel, AutoTokenizer, PreTrainedTokenizerFast
 
 from ..utils.logger import get_logger
-from ..config import EMBEDDING_MODEL_NAME, VECTOR_DIMENSION, FAISS_INDEX_PATH
+from ..config import (
+    EMBEDDING_MODEL_NAME, USE_INT8_EMBED, USE_TORCHSCRIPT_EMBED, EMBEDDING_ONNX_DIR, VECTOR_DIMENSION, FAISS_INDEX_PATH, FAISS_INDEX_KIND,
+    FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST, FAISS_IVF_NPROBE
+)
 
 logger = get_logger(__name__)
 
+# Let FAISS use every core for search/add
+faiss.omp_set_num_threads(os.cpu_count() or 1)
+
+
+def create_faiss_index(dimension: int, kind: str = FAISS_INDEX_KIND) -> faiss.Index:
+    """
+    Create an empty FAISS index of the configured kind.
+
+    "hnsw" builds an IndexHNSWFlat (graph search, no training needed),
+    "ivfpq" builds an IndexIVFPQ and "sq8" an 8-bit IndexScalarQuantizer
+    (both must be trained before vectors are added), anything else falls back
+    to an exact IndexFlatL2.
+    """
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+        return index
+
+    if kind == "ivfpq":
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, FAISS_IVF_NLIST, dimension // 4, 8)
+        index.nprobe = FAISS_IVF_NPROBE
+        return index
+
+    if kind == "sq8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+
+    return faiss.IndexFlatL2(dimension)
+
 
 class GlobalResources:
     """
@@ -20,8 +56,12 @@ class GlobalResources:
 
     _faiss_index: Optional[faiss.Index] = None
     _embedding_model: Optional[AutoModel] = None
+    _traced_embedding_model = None
     _embedding_tokenizer: Optional[AutoTokenizer] = None
-    _lock = threading.Lock()
+    _embedding_onnx_session = None
+    _db_models: Dict[str, Any] = {}
+    _vector_store = None
+    _lock = threading.RLock()  # Re-entrant: get_vector_store builds a store that fetches the index
 
     @staticmethod
     def get_faiss_index(dimension: int = VECTOR_DIMENSION) -> Optional[faiss.Index]:
@@ -43,8 +83,8 @@ class GlobalResources:
                             index = faiss.read_index(FAISS_INDEX_PATH)
                             logger.info(f"[INIT] Loaded FAISS index from disk: {FAISS_INDEX_PATH}")
                         else:
-                            index = faiss.IndexFlatL2(dimension)
-                            logger.warning("[INIT] No FAISS index file found. Initialized new IndexFlatL2.")
+                            index = create_faiss_index(dimension)
+                            logger.warning(f"[INIT] No FAISS index file found. Initialized new {type(index).__name__}.")
 
                         GlobalResources._faiss_index = index
 
@@ -73,6 +113,8 @@ class GlobalResources:
                         logger.info(f"[INIT] Loading embedding model: {EMBEDDING_MODEL_NAME}")
                         model = AutoModel.from_pretrained(EMBEDDING_MODEL_NAME)
                         model.eval()
+                        if USE_INT8_EMBED:
+                            model = GlobalResources._quantize_int8(model)
                         GlobalResources._embedding_model = model
                         logger.info("[INIT] Model loaded successfully.")
                     except Exception as e:
@@ -80,6 +122,93 @@ class GlobalResources:
 
         return GlobalResources._embedding_model
 
+    @staticmethod
+    def get_traced_embedding_model():
+        """
+        Get the embedding model traced and frozen with TorchScript.
+
+        Tracing takes seconds, so it runs once per process; the eager model is
+        cached instead if tracing fails or the traced graph disagrees with it.
+        """
+        if GlobalResources._traced_embedding_model is None:
+            with GlobalResources._lock:
+                if GlobalResources._traced_embedding_model is None:
+                    model = GlobalResources.get_embedding_model()
+                    tokenizer = GlobalResources.get_embedding_tokenizer()
+                    if model is None or tokenizer is None:
+                        return model
+                    GlobalResources._traced_embedding_model = GlobalResources._trace_model(model, tokenizer)
+        return GlobalResources._traced_embedding_model
+
+    @staticmethod
+    def _trace_model(model, tokenizer):
+        """Trace and freeze the encoder, falling back to the eager model."""
+        try:
+            dummy = tokenizer(["trace input"] * 2, padding=True, return_tensors='pt')
+            with torch.inference_mode():
+                traced = torch.jit.trace(model, (dummy['input_ids'], dummy['attention_mask']), strict=False)
+                traced = torch.jit.freeze(traced)
+
+                # Traced graphs can bake in shapes; check one the trace never saw
+                check = tokenizer(["a longer sentence to check the traced encoder", "short"], padding=True, return_tensors='pt')
+                expected = model(check['input_ids'], check['attention_mask'])['last_hidden_state']
+                actual = traced(check['input_ids'], check['attention_mask'])['last_hidden_state']
+            if not torch.allclose(expected, actual, atol=1e-4):
+                logger.warning("[INIT] TorchScript embedding model diverged from eager output; using eager model.")
+                return model
+            logger.info("[INIT] Embedding model traced and frozen with TorchScript.")
+            return traced
+        except Exception as e:
+            logger.warning(f"[INIT] TorchScript tracing failed, using eager embedding model: {e}")
+            return model
+
+    @staticmethod
+    def _quantize_int8(model: AutoModel) -> AutoModel:
+        """Swap the model's Linear layers for dynamically quantized INT8 ones."""
+        if "fbgemm" in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = "fbgemm"
+        quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info(f"[INIT] Quantized embedding model Linear layers to INT8 ({torch.backends.quantized.engine}).")
+        return quantized
+
+    @staticmethod
+    def get_embedding_onnx_session():
+        """
+        Get or initialize an ONNX Runtime session for the embedding model.
+
+        On first use the model is exported with optimum and dynamically
+        quantized to INT8 (AVX512-VNNI config); the result is cached under
+        EMBEDDING_ONNX_DIR. Returns None if onnxruntime/optimum are missing.
+        """
+        if GlobalResources._embedding_onnx_session is None:
+            with GlobalResources._lock:
+                if GlobalResources._embedding_onnx_session is None:
+                    try:
+                        import onnxruntime as ort
+
+                        model_path = EMBEDDING_ONNX_DIR / "model_quantized.onnx"
+                        if not model_path.exists():
+                            from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+                            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+                            logger.info(f"[INIT] Exporting {EMBEDDING_MODEL_NAME} to ONNX in {EMBEDDING_ONNX_DIR}")
+                            ort_model = ORTModelForFeatureExtraction.from_pretrained(EMBEDDING_MODEL_NAME, export=True)
+                            ort_model.save_pretrained(EMBEDDING_ONNX_DIR)
+                            quantizer = ORTQuantizer.from_pretrained(ort_model)
+                            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+                            quantizer.quantize(save_dir=EMBEDDING_ONNX_DIR, quantization_config=qconfig)
+
+                        options = ort.SessionOptions()
+                        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                        GlobalResources._embedding_onnx_session = ort.InferenceSession(
+                            str(model_path), options, providers=["CPUExecutionProvider"]
+                        )
+                        logger.info(f"[INIT] ONNX Runtime embedding session loaded from {model_path}")
+                    except Exception as e:
+                        logger.exception(f"[ERROR] Failed to initialize ONNX embedding session: {e}")
+
+        return GlobalResources._embedding_onnx_session
+
     @staticmethod
     def get_embedding_tokenizer() -> Optional[AutoTokenizer]:
         """Get or initialize tokenizer."""
@@ -88,7 +217,10 @@ class GlobalResources:
                 if GlobalResources._embedding_tokenizer is None:
                     try:
                         logger.info(f"[INIT] Loading tokenizer: {EMBEDDING_MODEL_NAME}")
-                        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+                        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME, use_fast=True)
+                        if not isinstance(tokenizer, PreTrainedTokenizerFast):
+                            logger.warning(f"[INIT] No fast (Rust) tokenizer for {EMBEDDING_MODEL_NAME}; using the slow Python one.")
+                        tokenizer.model_max_length = 512
                         GlobalResources._embedding_tokenizer = tokenizer
                         logger.info("[INIT] Tokenizer loaded successfully.")
                     except Exception as e:
@@ -96,11 +228,66 @@ class GlobalResources:
 
         return GlobalResources._embedding_tokenizer
 
+    @staticmethod
+    def _get_db_model(name: str, factory: Callable[[], Any]) -> Any:
+        """Get or create a process-wide database model instance."""
+        model = GlobalResources._db_models.get(name)
+        if model is None:
+            with GlobalResources._lock:
+                model = GlobalResources._db_models.get(name)
+                if model is None:
+                    model = factory()
+                    GlobalResources._db_models[name] = model
+        return model
+
+    @staticmethod
+    def get_conversation_model():
+        """Get the shared ConversationModel."""
+        from ..database.models import ConversationModel  # Imported lazily to avoid an import cycle
+        return GlobalResources._get_db_model("conversation", ConversationModel)
+
+    @staticmethod
+    def get_document_model():
+        """Get the shared DocumentModel."""
+        from ..database.models import DocumentModel
+        return GlobalResources._get_db_model("document", DocumentModel)
+
+    @staticmethod
+    def get_vector_index_model():
+        """Get the shared VectorIndexModel."""
+        from ..database.models import VectorIndexModel
+        return GlobalResources._get_db_model("vector_index", VectorIndexModel)
+
+    @staticmethod
+    def get_user_model():
+        """Get the shared UserModel."""
+        from ..database.models import UserModel
+        return GlobalResources._get_db_model("user", UserModel)
+
+    @staticmethod
+    def get_vector_store():
+        """
+        Get the process-wide VectorStore.
+
+        It wraps the singleton FAISS index, so one instance owns the in-memory
+        documents and is flushed once at interpreter shutdown.
+        """
+        if GlobalResources._vector_store is None:
+            with GlobalResources._lock:
+                if GlobalResources._vector_store is None:
+                    from ..database.vector_store import VectorStore  # Imported lazily to avoid an import cycle
+                    store = VectorStore()
+                    atexit.register(store.flush)
+                    GlobalResources._vector_store = store
+        return GlobalResources._vector_store
+
     @staticmethod
     def warm_up_resources():
         """Preload all resources to avoid cold starts."""
         logger.info("[INIT] Warming up global resources...")
         GlobalResources.get_embedding_model()
         GlobalResources.get_embedding_tokenizer()
+        if USE_TORCHSCRIPT_EMBED:
+            GlobalResources.get_traced_embedding_model()
         GlobalResources.get_faiss_index()
         logger.info("[INIT] Warm-up complete.")
@@ -5,7 +5,7 @@ import time
 from typing import List, Dict, Any
 
 from ..utils.logger import get_logger
-from .models import ConversationModel
+from ..core.resources import GlobalResources
 from ..config import MAX_HISTORY_MESSAGES
 
 logger = get_logger(__name__)
@@ -15,7 +15,7 @@ class ConversationStore:
     
     def __init__(self):
         """Initialize the conversation store."""
-        self.model = ConversationModel()
+        self.model = GlobalResources.get_conversation_model()
         self._cache = {}  # Simple in-memory cache for frequent requests
     
     def save_conversation(self, user_query: str, assistant_response: str, 
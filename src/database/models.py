@@ -3,7 +3,9 @@ SQLite database models for the Advanced RAG Chatbot.
 """
 import sqlite3
 import json
-from datetime import datetime
+import time
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
@@ -12,25 +14,105 @@ from ..config import DATABASE_PATH
 
 logger = get_logger(__name__)
 
+
+def _fetch_dicts(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """Fetch all rows as dicts, zipping plain tuples with the column names once."""
+    cursor.row_factory = None  # Skip building sqlite3.Row objects for bulk fetches
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
 class Database:
     """SQLite database connection manager."""
 
+    _instances: Dict[Path, "Database"] = {}
+    _lock = threading.Lock()
+
+    STATEMENT_CACHE_SIZE = 256
+    MMAP_SIZE = 1 << 30  # Bytes of the file read-only connections may memory-map
+    # Columns now holding UNIX seconds instead of local-time ISO strings
+    TIMESTAMP_COLUMNS = (
+        ("conversations", "query_timestamp"),
+        ("conversations", "response_timestamp"),
+        ("documents", "created_at"),
+        ("vector_index", "last_updated"),
+        ("users", "created_at"),
+        ("users", "last_login"),
+    )
+
     def __init__(self, db_path: Path = DATABASE_PATH):
         """Initialize the database connection."""
         self.db_path = db_path
+        self._local = threading.local()
         self._ensure_tables()
 
+    @classmethod
+    def instance(cls, db_path: Path = DATABASE_PATH) -> "Database":
+        """Get the shared Database for a path, creating its tables only once."""
+        db = cls._instances.get(db_path)
+        if db is None:
+            with cls._lock:
+                db = cls._instances.get(db_path)
+                if db is None:
+                    db = cls(db_path)
+                    cls._instances[db_path] = db
+        return db
+
     def _get_connection(self) -> sqlite3.Connection:
-        """Get a database connection."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        """
+        Get this thread's database connection.
+
+        Connections are kept open per thread so SQLite's prepared-statement
+        cache is reused across calls instead of being rebuilt every query.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, cached_statements=self.STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+            self._local.conn = conn
         return conn
 
+    def _get_read_connection(self) -> sqlite3.Connection:
+        """
+        Get this thread's read-only connection for SELECT-only queries.
+
+        The file is memory-mapped so reads skip the read() syscalls, and in
+        WAL mode these readers never wait on the writer connection.
+        """
+        conn = getattr(self._local, 'ro_conn', None)
+        if conn is None:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, cached_statements=self.STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f'PRAGMA mmap_size = {self.MMAP_SIZE}')
+            self._local.ro_conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several writes in one IMMEDIATE transaction with a single commit.
+
+        Yields a cursor; commits on success and rolls back on any exception.
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
     def _ensure_tables(self):
         """Ensure all required tables exist."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
 
+            # WAL lets the read-only connections run alongside the writer
+            cursor.execute('PRAGMA journal_mode = WAL')
+
             # Create conversations table
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS conversations (
@@ -39,8 +121,8 @@ class Database:
                 user_query TEXT NOT NULL,
                 assistant_response TEXT NOT NULL,
                 language TEXT NOT NULL,
-                query_timestamp TIMESTAMP NOT NULL,
-                response_timestamp TIMESTAMP NOT NULL,
+                query_timestamp REAL NOT NULL,
+                response_timestamp REAL NOT NULL,
                 response_time_seconds REAL NOT NULL
             )
             ''')
@@ -54,7 +136,7 @@ class Database:
                 source_file TEXT NOT NULL,
                 chunk_index INTEGER NOT NULL,
                 embedding_file TEXT,
-                created_at TIMESTAMP NOT NULL
+                created_at REAL NOT NULL
             )
             ''')
 
@@ -65,7 +147,7 @@ class Database:
                 index_name TEXT NOT NULL UNIQUE,
                 dimension INTEGER NOT NULL,
                 num_vectors INTEGER NOT NULL,
-                last_updated TIMESTAMP NOT NULL
+                last_updated REAL NOT NULL
             )
             ''')
 
@@ -77,11 +159,34 @@ class Database:
                 password_hash TEXT NOT NULL,
                 full_name TEXT NOT NULL,
                 employee_id TEXT UNIQUE,
-                created_at TIMESTAMP NOT NULL,
-                last_login TIMESTAMP
+                created_at REAL NOT NULL,
+                last_login REAL
             )
             ''')
 
+            # Indexes for the per-device, per-source lookups
+            # (users.email and users.employee_id are UNIQUE and already indexed)
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conv_device_ts
+            ON conversations(device_id, query_timestamp DESC)
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_doc_source
+            ON documents(source_file, chunk_index)
+            ''')
+
+            # Timestamps used to be stored as local-time ISO strings; convert
+            # them once to UNIX seconds so old and new rows compare like with
+            # like. Version 1 converted only the conversations columns.
+            if cursor.execute('PRAGMA user_version').fetchone()[0] < 2:
+                for table, column in self.TIMESTAMP_COLUMNS:
+                    cursor.execute(f'''
+                    UPDATE {table}
+                    SET {column} = (julianday({column}, 'utc') - 2440587.5) * 86400.0
+                    WHERE typeof({column}) = 'text'
+                    ''')
+                cursor.execute('PRAGMA user_version = 2')
+
             conn.commit()
             logger.info("Database tables initialized")
 
@@ -91,7 +196,7 @@ class ConversationModel:
 
     def __init__(self):
         """Initialize the conversation model."""
-        self.db = Database()
+        self.db = Database.instance()
 
     def save_conversation(self, device_id: str, user_query: str, assistant_response: str,
                          language: str, query_timestamp: float, response_timestamp: float) -> int:
@@ -110,8 +215,8 @@ class ConversationModel:
                 user_query,
                 assistant_response,
                 language,
-                datetime.fromtimestamp(query_timestamp).isoformat(),
-                datetime.fromtimestamp(response_timestamp).isoformat(),
+                query_timestamp,
+                response_timestamp,
                 response_time
             ))
             conn.commit()
@@ -119,7 +224,7 @@ class ConversationModel:
 
     def get_chat_messages(self, chat_id: str, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
         """Get paginated messages for a specific chat."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
             SELECT * FROM conversations
@@ -128,12 +233,11 @@ class ConversationModel:
             LIMIT ? OFFSET ?
             ''', (chat_id, limit, offset))
 
-            # Convert rows to dictionaries
-            return [dict(row) for row in cursor.fetchall()]
+            return _fetch_dicts(cursor)
 
     def get_chat_message_count(self, chat_id: str) -> int:
         """Get total number of messages in a chat."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
             SELECT COUNT(*) as count FROM conversations
@@ -144,7 +248,7 @@ class ConversationModel:
 
     def get_conversations(self, device_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get conversation history for a device."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
             SELECT * FROM conversations
@@ -153,8 +257,7 @@ class ConversationModel:
             LIMIT ?
             ''', (device_id, limit))
 
-            # Convert rows to dictionaries
-            return [dict(row) for row in cursor.fetchall()]
+            return _fetch_dicts(cursor)
 
 
 class DocumentModel:
@@ -162,7 +265,7 @@ class DocumentModel:
 
     def __init__(self):
         """Initialize the document model."""
-        self.db = Database()
+        self.db = Database.instance()
 
     def save_document(self, title: str, content: str, source_file: str,
                      chunk_index: int, embedding_file: Optional[str] = None) -> int:
@@ -179,14 +282,39 @@ class DocumentModel:
                 source_file,
                 chunk_index,
                 embedding_file,
-                datetime.now().isoformat()
+                time.time()
             ))
             conn.commit()
             return cursor.lastrowid
 
+    def save_documents(self, chunks: List[Dict[str, Any]]) -> List[int]:
+        """Save many document chunks in one transaction and return their IDs in order."""
+        if not chunks:
+            return []
+        created_at = time.time()
+        rows = [(
+            chunk["title"],
+            chunk["content"],
+            chunk["source_file"],
+            chunk["chunk_index"],
+            chunk.get("embedding_file"),
+            created_at
+        ) for chunk in chunks]
+
+        with self.db.transaction() as cursor:
+            cursor.executemany('''
+            INSERT INTO documents
+            (title, content, source_file, chunk_index, embedding_file, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            # The IMMEDIATE transaction holds the write lock, so the new IDs are contiguous
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
     def get_document(self, doc_id: int) -> Dict[str, Any]:
         """Get a document by ID."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM documents WHERE id = ?', (doc_id,))
             result = cursor.fetchone()
@@ -194,14 +322,14 @@ class DocumentModel:
 
     def get_documents_by_source(self, source_file: str) -> List[Dict[str, Any]]:
         """Get all documents from a specific source file."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
             SELECT * FROM documents
             WHERE source_file = ?
             ORDER BY chunk_index
             ''', (source_file,))
-            return [dict(row) for row in cursor.fetchall()]
+            return _fetch_dicts(cursor)
 
 
 class VectorIndexModel:
@@ -209,40 +337,33 @@ class VectorIndexModel:
 
     def __init__(self):
         """Initialize the vector index model."""
-        self.db = Database()
+        self.db = Database.instance()
 
     def save_index_metadata(self, index_name: str, dimension: int, num_vectors: int) -> int:
         """Save or update vector index metadata."""
         with self.db._get_connection() as conn:
             cursor = conn.cursor()
 
-            # Check if index already exists
-            cursor.execute('SELECT id FROM vector_index WHERE index_name = ?', (index_name,))
-            existing = cursor.fetchone()
-
-            if existing:
-                # Update existing index
-                cursor.execute('''
-                UPDATE vector_index
-                SET dimension = ?, num_vectors = ?, last_updated = ?
-                WHERE index_name = ?
-                ''', (dimension, num_vectors, datetime.now().isoformat(), index_name))
-                index_id = existing['id']
-            else:
-                # Create new index
-                cursor.execute('''
-                INSERT INTO vector_index
-                (index_name, dimension, num_vectors, last_updated)
-                VALUES (?, ?, ?, ?)
-                ''', (index_name, dimension, num_vectors, datetime.now().isoformat()))
-                index_id = cursor.lastrowid
+            # Insert or update and read back the row ID in a single statement
+            # (index_name is UNIQUE; RETURNING needs SQLite 3.35+)
+            cursor.execute('''
+            INSERT INTO vector_index
+            (index_name, dimension, num_vectors, last_updated)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(index_name) DO UPDATE SET
+                dimension = excluded.dimension,
+                num_vectors = excluded.num_vectors,
+                last_updated = excluded.last_updated
+            RETURNING id
+            ''', (index_name, dimension, num_vectors, time.time()))
+            index_id = cursor.fetchone()['id']
 
             conn.commit()
             return index_id
 
     def get_index_metadata(self, index_name: str) -> Dict[str, Any]:
         """Get vector index metadata."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM vector_index WHERE index_name = ?', (index_name,))
             result = cursor.fetchone()
@@ -254,7 +375,7 @@ class UserModel:
 
     def __init__(self):
         """Initialize the user model."""
-        self.db = Database()
+        self.db = Database.instance()
 
     def create_user(self, email: str, password_hash: str, full_name: str, employee_id: str = None) -> int:
         """Create a new user."""
@@ -270,7 +391,7 @@ class UserModel:
                     password_hash,
                     full_name,
                     employee_id,
-                    datetime.now().isoformat()
+                    time.time()
                 ))
                 conn.commit()
                 return cursor.lastrowid
@@ -281,7 +402,7 @@ class UserModel:
 
     def get_user_by_email(self, email: str) -> Dict[str, Any]:
         """Get a user by email."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
             result = cursor.fetchone()
@@ -289,7 +410,7 @@ class UserModel:
 
     def get_user_by_id(self, user_id: int) -> Dict[str, Any]:
         """Get a user by ID."""
-        with self.db._get_connection() as conn:
+        with self.db._get_read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
             result = cursor.fetchone()
@@ -303,6 +424,6 @@ class UserModel:
             UPDATE users
             SET last_login = ?
             WHERE id = ?
-            ''', (datetime.now().isoformat(), user_id))
+            ''', (time.time(), user_id))
             conn.commit()
             return cursor.rowcount > 0
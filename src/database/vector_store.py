@@ -3,10 +3,19 @@ Vector store for document embeddings.
 """
 import os
 import json
+import time
+import threading
+import faiss
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
+# Optional imports
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from ..utils.logger import get_logger
 # from ..utils.faiss_utils import initialize_faiss, get_faiss_index # Remove these imports
 from ..config import DATA_DIR, VECTOR_DIMENSION
@@ -16,6 +25,12 @@ logger = get_logger(__name__)
 
 class VectorStore:
     """Store and retrieve document embeddings using FAISS."""
+
+    # Persist to disk once this many vectors are pending, or this many seconds
+    # have passed since the last save; otherwise wait for flush(). The shared
+    # instance from GlobalResources.get_vector_store() is also flushed at exit.
+    FLUSH_THRESHOLD_VECTORS = 10_000
+    FLUSH_INTERVAL_SECONDS = 300
     
     def __init__(self, dimension: int = VECTOR_DIMENSION):
         """
@@ -28,7 +43,14 @@ class VectorStore:
         # Get the singleton FAISS index
         self.index = GlobalResources.get_faiss_index(dimension)
         self.documents = []
-        self.vectors = np.zeros((0, dimension))  # Store vectors in memory
+        # Vectors live in a geometrically grown buffer; self.vectors is a view
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+        self._size = 0
+        self._dirty_count = 0  # Vectors added since the last save
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+        # Exact index serving searches until the main index has enough vectors to train
+        self._staging_index: Optional[faiss.Index] = None
         
         # Load existing documents and vectors
         self._load_documents()
@@ -41,6 +63,65 @@ class VectorStore:
             
         logger.info(f"Vector store initialized with {len(self.documents)} documents")
         
+    @property
+    def vectors(self) -> np.ndarray:
+        """In-memory vectors, as a view over the filled part of the buffer."""
+        return self._vectors[:self._size]
+
+    @vectors.setter
+    def vectors(self, value: np.ndarray):
+        self._vectors = np.ascontiguousarray(value, dtype=np.float32).reshape(-1, self.dimension)
+        self._size = len(self._vectors)
+
+    def _append_vectors(self, vectors: np.ndarray):
+        """Append vectors, doubling the buffer capacity when it is full."""
+        needed = self._size + len(vectors)
+        if needed > len(self._vectors):
+            capacity = max(2 * len(self._vectors), needed)
+            grown = np.empty((capacity, self.dimension), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size:needed] = vectors
+        self._size = needed
+
+    @staticmethod
+    def _as_float32(array: np.ndarray, name: str) -> np.ndarray:
+        """Return a C-contiguous float32 array, warning when that costs a copy."""
+        if array.dtype == np.float32 and array.flags['C_CONTIGUOUS']:
+            return array
+        logger.warning(f"Copying {name} to contiguous float32 (got {array.dtype}); fix the producer to avoid this")
+        return np.ascontiguousarray(array, dtype=np.float32)
+
+    def _min_training_vectors(self) -> int:
+        """Vectors needed before the main index can be trained (~39 per IVF list)."""
+        nlist = getattr(self.index, "nlist", 0)
+        return 39 * nlist if nlist else 1
+
+    def _index_vectors(self, vectors: np.ndarray):
+        """
+        Add vectors to the main index, training it once enough are held.
+
+        Until then they go to an exact flat index so they stay searchable;
+        vectors are appended to self.vectors before this is called.
+        """
+        if self.index.is_trained:
+            self.index.add(vectors)
+            return
+        if self._size < self._min_training_vectors():
+            if self._staging_index is None:
+                self._staging_index = faiss.IndexFlatL2(self.dimension)
+            self._staging_index.add(vectors)
+            logger.info(f"Staged {len(vectors)} vectors in a flat index until {self._min_training_vectors()} are available for training")
+            return
+        logger.info(f"Training FAISS index on {self._size} vectors")
+        self.index.train(self.vectors)
+        self.index.add(self.vectors)
+        self._staging_index = None
+
+    def _search_index(self) -> faiss.Index:
+        """The index that currently holds every stored vector."""
+        return self._staging_index if self._staging_index is not None else self.index
+
     def _load_documents(self):
         """
         Load existing documents from disk.
@@ -55,8 +136,12 @@ class VectorStore:
             # Load documents from embeddings directory
             docs_path = DATA_DIR / "embeddings" / "documents.json"
             if docs_path.exists():
-                with open(docs_path, 'r', encoding='utf-8') as f:
-                    self.documents = json.load(f)
+                if orjson is not None:
+                    with open(docs_path, 'rb') as f:
+                        self.documents = orjson.loads(f.read())
+                else:
+                    with open(docs_path, 'r', encoding='utf-8') as f:
+                        self.documents = json.load(f)
                 logger.info(f"Loaded {len(self.documents)} documents from disk")
 
                 # Load vectors from embeddings directory
@@ -66,9 +151,9 @@ class VectorStore:
                     if len(self.vectors) == len(self.documents):
                         # Only add vectors to index if it's empty
                         if self.index.ntotal == 0:
-                            self.index.add(self.vectors)
+                            self._index_vectors(self.vectors)
                             logger.info(f"Added {len(self.vectors)} vectors to FAISS index")
-                            logger.info(f"FAISS index now contains {self.index.ntotal} vectors")
+                            logger.info(f"FAISS index now contains {self._search_index().ntotal} vectors")
                         else:
                             logger.info(f"FAISS index already contains {self.index.ntotal} vectors, skipping vector loading")
                     else:
@@ -81,47 +166,62 @@ class VectorStore:
         except Exception as e:
             logger.error(f"Error loading documents: {str(e)}", exc_info=True)
             
-    def add_documents(self, documents: List[Dict[str, Any]], vectors: np.ndarray):
+    def add_documents(self, documents: List[Dict[str, Any]], vectors: np.ndarray) -> bool:
         """
         Add documents and their embeddings to the store.
         
         Args:
             documents: List of document dictionaries
             vectors: Numpy array of document embeddings
+            
+        Returns:
+            True if the documents were indexed, False if they were rejected
         """
         try:
             if self.index is None:
                 logger.error("FAISS index not initialized")
-                return
+                return False
                 
+            vectors = self._as_float32(vectors, "document vectors")
+
             # Verify vector dimensions
             if vectors.shape[1] != self.dimension:
                 logger.error(f"Vector dimension mismatch: expected {self.dimension}, got {vectors.shape[1]}")
-                return
+                return False
                 
             # Log pre-addition state
             logger.info(f"Adding {len(documents)} documents and {len(vectors)} vectors")
             logger.info(f"Current FAISS index size: {self.index.ntotal} vectors")
                 
-            # Add vectors to index
-            self.index.add(vectors)
-            
-            # Store vectors in memory
-            self.vectors = np.vstack([self.vectors, vectors])
+            # Store vectors in memory; an untrained IVF-PQ index trains on all of them
+            size_before = self._size
+            self._append_vectors(vectors)
+
+            # Add vectors to index, dropping them from memory again if that fails
+            try:
+                self._index_vectors(vectors)
+            except Exception:
+                self._size = size_before
+                raise
             
             # Add documents to list
             self.documents.extend(documents)
             
             # Log post-addition state
             logger.info(f"Added {len(vectors)} vectors to FAISS index")
-            logger.info(f"FAISS index now contains {self.index.ntotal} vectors")
+            logger.info(f"FAISS index now contains {self._search_index().ntotal} vectors")
             logger.info(f"Total documents in store: {len(self.documents)}")
             
-            # Save to disk
-            self._save_to_disk()
+            # Defer the full rewrite until enough vectors are pending
+            self._dirty_count += len(vectors)
+            if (self._dirty_count >= self.FLUSH_THRESHOLD_VECTORS or
+                    time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL_SECONDS):
+                self.flush()
+            return True
             
         except Exception as e:
             logger.error(f"Error adding documents: {str(e)}", exc_info=True)
+            return False
             
     def search(self, query_embedding: np.ndarray, top_k=5) -> List[Dict[str, Any]]:
         """
@@ -143,6 +243,8 @@ class VectorStore:
                 logger.warning("No documents available for search")
                 return []
                 
+            query_embedding = self._as_float32(np.asarray(query_embedding), "query embedding")
+
             # Ensure query embedding is 2D
             if query_embedding.ndim == 1:
                 query_embedding = query_embedding.reshape(1, -1)
@@ -153,22 +255,12 @@ class VectorStore:
                 return []
                 
             # Search index
-            distances, indices = self.index.search(query_embedding, top_k)
+            distances, indices = self._search_index().search(query_embedding, top_k)
             
             # Get documents
-            results = []
-            total_chars = 0
-            sources = set()
-            
-            for i, idx in enumerate(indices[0]):
-                if idx < len(self.documents):
-                    doc = self.documents[idx].copy()
-                    doc['score'] = float(distances[0][i])
-                    results.append(doc)
-                    
-                    # Track context statistics
-                    total_chars += len(doc['content'])
-                    sources.add(doc['source_file'])
+            results = self._collect_hits(distances[0], indices[0])
+            total_chars = sum(len(doc['content']) for doc in results)
+            sources = {doc['source_file'] for doc in results}
             
             # Log retrieval statistics
             logger.info(f"Retrieved {len(results)} chunks from {len(sources)} sources")
@@ -183,6 +275,68 @@ class VectorStore:
             logger.error(f"Error searching documents: {e}", exc_info=True)
             return []
             
+    def search_batch(self, query_embeddings: np.ndarray, top_k=5) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several query embeddings with a single FAISS call.
+        
+        Args:
+            query_embeddings: Matrix of query embeddings, one per row
+            top_k: Number of results to return per query
+            
+        Returns:
+            One list of similar documents per query, in query order
+        """
+        try:
+            query_embeddings = self._as_float32(np.atleast_2d(query_embeddings), "query embeddings")
+
+            if self.index is None:
+                logger.error("FAISS index not initialized")
+                return [[] for _ in range(len(query_embeddings))]
+
+            if len(self.documents) == 0:
+                logger.warning("No documents available for search")
+                return [[] for _ in range(len(query_embeddings))]
+
+            if query_embeddings.shape[1] != self.dimension:
+                logger.error(f"Query embedding dimension mismatch: expected {self.dimension}, got {query_embeddings.shape[1]}")
+                return [[] for _ in range(len(query_embeddings))]
+
+            # FAISS parallelises across the rows of the query matrix
+            distances, indices = self._search_index().search(query_embeddings, top_k)
+            results = [self._collect_hits(d, i) for d, i in zip(distances, indices)]
+
+            logger.info(f"Batch search for {len(results)} queries retrieved {sum(len(r) for r in results)} chunks")
+            return results
+
+        except Exception as e:
+            logger.error(f"Error batch searching documents: {e}", exc_info=True)
+            return [[] for _ in range(len(np.atleast_2d(query_embeddings)))]
+
+    def _collect_hits(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Map one row of FAISS results to scored document copies, in rank order."""
+        results = []
+        num_documents = len(self.documents)
+        for distance, idx in zip(distances, indices):
+            # FAISS pads missing results with -1
+            if 0 <= idx < num_documents:
+                doc = self.documents[idx].copy()
+                doc['score'] = float(distance)
+                results.append(doc)
+        return results
+
+    def flush(self):
+        """Save pending documents and vectors to disk, if any were added."""
+        with self._flush_lock:
+            if self._dirty_count == 0:
+                return
+            self._save_to_disk()
+            self._dirty_count = 0
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush pending additions; call when ingestion is finished."""
+        self.flush()
+            
     def _save_to_disk(self):
         """Save documents and vectors to disk."""
         try:
@@ -196,13 +350,22 @@ class VectorStore:
             
             # Save documents to embeddings directory
             docs_path = embeddings_dir / "documents.json"
-            with open(docs_path, 'w', encoding='utf-8') as f:
-                json.dump(self.documents, f, ensure_ascii=False, indent=2)
+            if orjson is not None:
+                with open(docs_path, 'wb') as f:
+                    f.write(orjson.dumps(self.documents, option=orjson.OPT_NON_STR_KEYS))
+            else:
+                with open(docs_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.documents, f, ensure_ascii=False)
                 
             # Save vectors to embeddings directory
             if len(self.vectors) > 0:
                 vectors_path = embeddings_dir / "vectors.npy"
-                np.save(vectors_path, self.vectors)
+                # Stored as float16 to halve the file; widened back to float32 on load.
+                # The memmap writer narrows in place instead of building an FP16 copy.
+                fp = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float16, shape=self.vectors.shape)
+                fp[:] = self.vectors
+                fp.flush()
+                del fp
                 logger.info(f"Saved {len(self.vectors)} vectors to disk")
                 
         except Exception as e:
@@ -214,8 +377,12 @@ class VectorStore:
             # Ensure index is available before resetting
             if self.index is not None:
                 self.index.reset()
+            self._staging_index = None
             self.documents = []
-            self.vectors = np.zeros((0, self.dimension))
-            self._save_to_disk()
+            self.vectors = np.empty((0, self.dimension), dtype=np.float32)
+            with self._flush_lock:
+                self._save_to_disk()
+                self._dirty_count = 0
+                self._last_flush = time.monotonic()
         except Exception as e:
             logger.error(f"Error clearing vector store: {e}", exc_info=True)
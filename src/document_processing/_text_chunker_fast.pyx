@@ -0,0 +1,54 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled paragraph packing for TextChunker. Built by setup.py when Cython is
+available; text_chunker falls back to the identical Python loop otherwise.
+"""
+from ..utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+cdef inline str _emit(list chunks, str chunk, str prev_chunk, Py_ssize_t chunk_overlap, bint include_overlap):
+    # Chunks are stripped, so only the start of a borrowed tail can carry whitespace
+    if include_overlap and prev_chunk is not None:
+        chunks.append(prev_chunk[-chunk_overlap:].lstrip() + chunk)
+    else:
+        chunks.append(chunk)
+    return chunk
+
+
+cpdef list pack_paragraphs(object paragraphs, Py_ssize_t chunk_size, Py_ssize_t chunk_overlap, bint include_overlap):
+    cdef list chunks = []
+    cdef list buf = []
+    cdef str prev_chunk = None
+    cdef Py_ssize_t cur_len = 0
+    cdef Py_ssize_t n, i
+    cdef Py_ssize_t step = chunk_size - chunk_overlap
+    cdef str para
+
+    for para in paragraphs:
+        n = len(para)
+        if cur_len + n + 2 <= chunk_size:
+            buf.append(para)
+            cur_len += n + 2
+            continue
+
+        if buf:
+            prev_chunk = _emit(chunks, "\n\n".join(buf), prev_chunk, chunk_overlap, include_overlap)
+            buf = []
+        cur_len = 0
+
+        if n > chunk_size:
+            logger.warning(f"Oversized paragraph of length {n} – will be force-split.")
+            if step == 0:
+                raise ValueError("range() arg 3 must not be zero")  # Same as the Python fallback
+            if step > 0:
+                for i in range(0, n, step):
+                    prev_chunk = _emit(chunks, para[i:i + chunk_size].strip(), prev_chunk, chunk_overlap, include_overlap)
+        else:
+            buf.append(para)
+            cur_len = n + 2
+
+    if buf:
+        _emit(chunks, "\n\n".join(buf), prev_chunk, chunk_overlap, include_overlap)
+    return chunks
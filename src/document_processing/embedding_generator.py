@@ -2,37 +2,128 @@
 Generate embeddings for document chunks using Hugging Face Transformers.
 """
 import os
+import threading
 import numpy as np
-from typing import List, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Union
 from pathlib import Path
 import torch
-from transformers import AutoTokenizer, AutoModel
 
 from ..utils.logger import get_logger
-from ..config import EMBEDDING_MODEL_NAME, EMBEDDINGS_DIR, VECTOR_DIMENSION
+from ..config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDINGS_DIR, VECTOR_DIMENSION, USE_EMBEDDING_CACHE,
+    USE_INT8_EMBED, USE_TORCHSCRIPT_EMBED, USE_BF16_QUERY_EMBED, EMBEDDING_TORCH_THREADS
+)
 from ..core.resources import GlobalResources
+from ..cache.embedding_cache import EmbeddingCache
 
 logger = get_logger(__name__)
 
+_ZERO_EMB = np.zeros(VECTOR_DIMENSION, dtype=np.float32)  # Failure fallback; hand out copies
+_torch_threads_configured = False
+
+
+def _configure_torch_threads():
+    """Size PyTorch's CPU thread pools once per process."""
+    global _torch_threads_configured
+    if _torch_threads_configured:
+        return
+    _torch_threads_configured = True
+    torch.set_num_threads(EMBEDDING_TORCH_THREADS)
+    torch.backends.mkldnn.enabled = True
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError as e:
+        # Only allowed before the first inter-op parallel work in the process
+        logger.warning(f"Could not set PyTorch inter-op threads: {e}")
+
+
 class EmbeddingGenerator:
     """Generate embeddings for document chunks using Hugging Face Transformers."""
 
+    QUERY_CACHE_SIZE = 1024  # Query embeddings kept in the in-memory LRU
+
     def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
         self.model_name = model_name
         self.device = torch.device("cpu")  # ⛔ Enforce CPU-only mode
+        _configure_torch_threads()
 
         # Load tokenizer and model using GlobalResources
         self.tokenizer = GlobalResources.get_embedding_tokenizer()
-        self.model = GlobalResources.get_embedding_model().to(self.device)
-        self.model.eval()
+        self.ort_session = GlobalResources.get_embedding_onnx_session() if EMBEDDING_BACKEND == "onnx" else None
+        self.model = None
+        if self.ort_session is None:
+            if USE_TORCHSCRIPT_EMBED:
+                # Traced once per process and shared, like the eager model
+                self.model = GlobalResources.get_traced_embedding_model()
+            else:
+                self.model = GlobalResources.get_embedding_model().to(self.device)
+                self.model.eval()
+            if USE_BF16_QUERY_EMBED and isinstance(self.model, torch.jit.ScriptModule):
+                logger.warning("USE_BF16_QUERY_EMBED has no effect on the TorchScript embedding model; "
+                               "set USE_TORCHSCRIPT_EMBED=false to use BF16 query embeddings")
+
+        self.cache = None
+        if USE_EMBEDDING_CACHE:
+            backend = "onnx" if self.ort_session is not None else "int8" if USE_INT8_EMBED else "torch"
+            try:
+                self.cache = EmbeddingCache(namespace=f"{model_name}:{backend}")
+            except Exception as e:
+                logger.warning(f"Embedding cache unavailable, embedding every chunk: {e}")
+
+        # Queries are one-off and unbounded in number, so they stay out of the
+        # persistent cache and only live in a bounded in-memory LRU
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
 
     def _mean_pooling(self, model_output, attention_mask):
         """
         Mean pooling strategy to generate sentence embeddings.
         """
-        token_embeddings = model_output[0]  # last hidden state
-        input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-        return (token_embeddings * input_mask_expanded).sum(1) / input_mask_expanded.sum(1)
+        token_embeddings = model_output['last_hidden_state']
+        # One batched contraction instead of materializing an expanded (B, T, H) mask
+        mask = attention_mask.to(token_embeddings.dtype)
+        summed = torch.einsum('bth,bt->bh', token_embeddings, mask)
+        return summed / mask.sum(1, keepdim=True).clamp_min(1e-9)
+
+    @staticmethod
+    def _mean_pooling_np(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """
+        NumPy mean pooling for ONNX Runtime outputs.
+        """
+        mask = attention_mask.astype(token_embeddings.dtype)
+        summed = np.einsum('bth,bt->bh', token_embeddings, mask)
+        return summed / np.clip(mask.sum(axis=1, keepdims=True), 1e-9, None)
+
+    def _tokenize(self, texts: Union[str, List[str]]):
+        return_tensors = 'np' if self.ort_session is not None else 'pt'
+        return self.tokenizer(texts, padding='longest', truncation=True, max_length=512,
+                              return_overflowing_tokens=False, return_tensors=return_tensors)
+
+    def _forward(self, encoded_input, bf16: bool = False) -> np.ndarray:
+        """
+        Run tokenized input through the encoder and mean-pool it into a
+        (batch, dim) array. bf16 runs the eager torch model under BF16 autocast.
+        """
+        if self.ort_session is not None:
+            feed = {inp.name: encoded_input[inp.name].astype(np.int64) for inp in self.ort_session.get_inputs()}
+            token_embeddings = self.ort_session.run(None, feed)[0]
+            return self._mean_pooling_np(token_embeddings, encoded_input['attention_mask'])
+
+        encoded_input = encoded_input.to(self.device)
+        use_bf16 = bf16 and not isinstance(self.model, torch.jit.ScriptModule)
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=use_bf16):
+            # Positional call so eager and traced models share one signature
+            model_output = self.model(encoded_input['input_ids'], encoded_input['attention_mask'])
+            embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
+        return embeddings.float().cpu().numpy()
+
+    def _embed_batch(self, texts: Union[str, List[str]], bf16: bool = False) -> np.ndarray:
+        """
+        Encode one batch of texts (or a single string) into a (batch, dim) array.
+        """
+        return self._forward(self._tokenize(texts), bf16=bf16)
 
     def generate_embeddings(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         texts = [doc["content"] for doc in documents]
@@ -40,29 +131,64 @@ class EmbeddingGenerator:
         try:
             logger.info(f"Generating embeddings for {len(texts)} documents")
 
-            # Batch control based on average text length
-            avg_length = sum(len(t) for t in texts) / max(1, len(texts))
-            batch_size = 32 if avg_length < 500 else 16 if avg_length < 1000 else 8
+            # Embed each distinct text once; duplicates (headers, footers,
+            # disclaimers) are scattered back from the unique result
+            unique_ids: Dict[str, int] = {}
+            inverse = [unique_ids.setdefault(t, len(unique_ids)) for t in texts]
+            unique_texts = list(unique_ids)
+            if len(unique_texts) < len(texts):
+                logger.info(f"Embedding {len(unique_texts)} unique texts for {len(texts)} documents")
+
+            unique_embeddings = np.empty((len(unique_texts), VECTOR_DIMENSION), dtype=np.float32)
+
+            # Only texts without a cached vector go through the model
+            keys = [self.cache.key(t) for t in unique_texts] if self.cache else []
+            cached = self.cache.get_many(keys) if self.cache else {}
+            missing = []
+            for i in range(len(unique_texts)):
+                if keys and keys[i] in cached:
+                    unique_embeddings[i] = cached[keys[i]]
+                else:
+                    missing.append(i)
+
+            if cached:
+                logger.info(f"Embedding cache hit for {len(unique_texts) - len(missing)}/{len(unique_texts)} unique texts")
+
+            if missing:
+                missing_texts = [unique_texts[i] for i in missing]
 
-            logger.info(f"Using batch size {batch_size} for average length {avg_length:.1f}")
-            all_embeddings = []
+                # Batch control based on average text length
+                avg_length = sum(len(t) for t in missing_texts) / len(missing_texts)
+                batch_size = 32 if avg_length < 500 else 16 if avg_length < 1000 else 8
 
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-                encoded_input = self.tokenizer(batch_texts, padding=True, truncation=True, return_tensors='pt').to(self.device)
+                logger.info(f"Using batch size {batch_size} for average length {avg_length:.1f}")
 
-                with torch.no_grad():
-                    model_output = self.model(**encoded_input)
-                    embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
+                # Batch texts of similar token length together so padding stays short
+                lengths = [len(ids) for ids in self.tokenizer(missing_texts, truncation=True, max_length=512, add_special_tokens=True)["input_ids"]]
+                order = np.asarray(missing)[np.argsort(lengths, kind="stable")]
 
-                embeddings_np = embeddings.cpu().numpy()
-                all_embeddings.append(embeddings_np)
+                batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
 
-            final_embeddings = np.vstack(all_embeddings)
+                # Tokenize one batch ahead on a helper thread; the forward pass
+                # releases the GIL, so the two overlap
+                with ThreadPoolExecutor(max_workers=1) as prefetch:
+                    pending = prefetch.submit(self._tokenize, [unique_texts[j] for j in batches[0]])
+                    for n, batch_order in enumerate(batches):
+                        encoded_input = pending.result()
+                        if n + 1 < len(batches):
+                            pending = prefetch.submit(self._tokenize, [unique_texts[j] for j in batches[n + 1]])
+                        batch_embeddings = self._forward(encoded_input)
 
-            # ✅ Check for correct vector dimension
-            if final_embeddings.shape[1] != VECTOR_DIMENSION:
-                raise ValueError(f"❌ Embedding dimension mismatch: Expected {VECTOR_DIMENSION}, got {final_embeddings.shape[1]}")
+                        if batch_embeddings.shape[1] != VECTOR_DIMENSION:
+                            raise ValueError(f"❌ Embedding dimension mismatch: Expected {VECTOR_DIMENSION}, got {batch_embeddings.shape[1]}")
+
+                        # Write straight into each text's unique slot
+                        unique_embeddings[batch_order] = batch_embeddings
+
+                if self.cache:
+                    self.cache.put_many([keys[i] for i in missing], unique_embeddings[missing])
+
+            final_embeddings = unique_embeddings[inverse] if len(unique_texts) < len(texts) else unique_embeddings
 
             logger.info(f"Generated {len(final_embeddings)} embeddings with dimension {final_embeddings.shape[1]}")
 
@@ -77,28 +203,40 @@ class EmbeddingGenerator:
 
     def generate_query_embedding(self, query: str) -> np.ndarray:
         try:
-            encoded_input = self.tokenizer([query], padding=True, truncation=True, return_tensors='pt').to(self.device)
+            # Repeated queries skip tokenization and the forward pass entirely
+            with self._query_cache_lock:
+                cached = self._query_cache.get(query)
+                if cached is not None:
+                    self._query_cache.move_to_end(query)
+                    return cached.copy()
 
-            with torch.no_grad():
-                model_output = self.model(**encoded_input)
-                embedding = self._mean_pooling(model_output, encoded_input['attention_mask'])
-
-            embedding_np = embedding[0].cpu().numpy()
+            embedding_np = self._embed_batch(query, bf16=USE_BF16_QUERY_EMBED)[0]
 
             # Graceful fallback if dimension mismatch
             if embedding_np.shape[0] != VECTOR_DIMENSION:
                 logger.warning(f"⚠️ Query embedding dimension mismatch: Expected {VECTOR_DIMENSION}, got {embedding_np.shape[0]}")
-                return np.zeros(VECTOR_DIMENSION)
+                return _ZERO_EMB.copy()
+
+            with self._query_cache_lock:
+                self._query_cache[query] = embedding_np
+                self._query_cache.move_to_end(query)
+                while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
 
-            return embedding_np
+            return embedding_np.copy()
 
         except Exception as e:
             logger.error(f"Error generating query embedding: {e}", exc_info=True)
-            return np.zeros(VECTOR_DIMENSION)
+            return _ZERO_EMB.copy()
 
     def save_embeddings(self, embeddings: np.ndarray, name: str) -> Path:
         os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
         file_path = EMBEDDINGS_DIR / f"{name}.npy"
-        np.save(file_path, embeddings)
+        # FP16 on disk halves size; the memmap writer narrows in place with no
+        # intermediate FP16 copy. Widen with np.asarray(..., dtype=np.float32) on load.
+        fp = np.lib.format.open_memmap(file_path, mode='w+', dtype=np.float16, shape=embeddings.shape)
+        fp[:] = embeddings
+        fp.flush()
+        del fp
         logger.info(f"Saved embeddings to {file_path}")
         return file_path
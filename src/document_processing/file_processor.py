@@ -1,63 +1,53 @@
 """
 Process different file types for document ingestion.
 """
+import io
 import os
 import re
+import mmap
+import importlib
 import unicodedata
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional
 from pathlib import Path
-
-# Optional imports
-try:
-    import docx
-except ImportError:
-    docx = None
-
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
-
-try:
-    import pandas as pd
-except ImportError:
-    pd = None
-
-try:
-    from pptx import Presentation
-except ImportError:
-    Presentation = None
-
-try:
-    import textract
-except ImportError:
-    textract = None
-
-try:
-    import extract_msg
-except ImportError:
-    extract_msg = None
-
-try:
-    import markdown
-    from bs4 import BeautifulSoup
-    markdown_available = True
-except ImportError:
-    markdown_available = False
-
-try:
-    from PIL import Image
-    import pytesseract
-except ImportError:
-    Image = None
-    pytesseract = None
-
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 
 # Replace with your own logger if needed
 import logging
 logger = logging.getLogger(__name__)
 
+# Optional extractor dependencies, imported on first use (None if not installed)
+_OPTIONAL_MODULES: Dict[str, Any] = {}
+
+
+def _lazy(name: str):
+    if name not in _OPTIONAL_MODULES:
+        try:
+            _OPTIONAL_MODULES[name] = importlib.import_module(name)
+        except ImportError:
+            _OPTIONAL_MODULES[name] = None
+    return _OPTIONAL_MODULES[name]
+
+
+# Markdown -> plain text, applied in order. Covers the common subset
+# (fences, headings, quotes, lists, rules, links, images, emphasis, inline HTML).
+_MARKDOWN_RULES = [
+    (re.compile(r'^[ \t]*(?:```|~~~).*$', re.M), ''),
+    (re.compile(r'^[ \t]*(?:[-*_][ \t]*){3,}$', re.M), ''),
+    (re.compile(r'^[ \t]*(?:>[ \t]?)+', re.M), ''),
+    (re.compile(r'^[ \t]*(?:#{1,6}[ \t]+|[-*+][ \t]+|\d+[.)][ \t]+)', re.M), ''),
+    (re.compile(r'!?\[([^\]]*)\]\([^)]*\)'), r'\1'),
+    (re.compile(r'<[^>\n]+>'), ''),
+    (re.compile(r'(\*\*|\*|~~|`)(?=\S)(.+?)(?<=\S)\1'), r'\2'),
+    (re.compile(r'(?<!\w)(__|_)(?=\S)(.+?)(?<=\S)\1(?!\w)'), r'\2'),
+]
+
+
+def _strip_markdown(md_text: str) -> str:
+    for pattern, replacement in _MARKDOWN_RULES:
+        md_text = pattern.sub(replacement, md_text)
+    return md_text
+
+
 class FileProcessor:
     """Process different file types for text extraction."""
 
@@ -66,6 +56,7 @@ class FileProcessor:
         '.pptx', '.html', '.htm', '.msg', '.jpg', '.jpeg', '.png'
     }
     MAX_FILE_SIZE_MB = 20
+    _HANDLERS: Dict[str, Callable[[Path], str]] = {}  # Filled in once, below the class
 
     @staticmethod
     def process_file(file_path: Path) -> Dict[str, Any]:
@@ -103,30 +94,34 @@ class FileProcessor:
             logger.error(f"Error processing file {file_path}: {e}")
             return FileProcessor._error_doc(file_path, str(e), title)
 
+    @staticmethod
+    def process_files(file_paths: List[Path], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Extract several files in parallel worker processes.
+
+        Results are returned in the same order as file_paths. Falls back to
+        extracting serially in this process if the pool cannot be used.
+        """
+        file_paths = list(file_paths)
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(file_paths) <= 1:
+            return [FileProcessor.process_file(path) for path in file_paths]
+
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+                return list(executor.map(FileProcessor.process_file, file_paths, chunksize=4))
+        except Exception as e:
+            logger.warning(f"Process pool extraction failed ({e}); falling back to serial extraction")
+            return [FileProcessor.process_file(path) for path in file_paths]
+
     @staticmethod
     def _get_handler(extension: str):
-        return {
-            '.pdf': FileProcessor.extract_from_pdf,
-            '.docx': FileProcessor.extract_from_docx,
-            '.doc': FileProcessor.extract_from_doc,
-            '.txt': FileProcessor.extract_from_txt,
-            '.md': FileProcessor.extract_from_markdown,
-            '.csv': FileProcessor.extract_from_csv,
-            '.xls': FileProcessor.extract_from_excel,
-            '.xlsx': FileProcessor.extract_from_excel,
-            '.pptx': FileProcessor.extract_from_pptx,
-            '.html': FileProcessor.extract_from_html,
-            '.htm': FileProcessor.extract_from_html,
-            '.msg': FileProcessor.extract_from_msg,
-            '.jpg': FileProcessor.extract_from_image,
-            '.jpeg': FileProcessor.extract_from_image,
-            '.png': FileProcessor.extract_from_image
-        }.get(extension, FileProcessor.extract_from_txt)
+        return FileProcessor._HANDLERS.get(extension, FileProcessor.extract_from_txt)
 
     @staticmethod
     def _generate_title(file_name: str, file_extension: str) -> str:
         title = file_name.replace(file_extension, '').replace('-', ' ').replace('_', ' ')
-        return re.sub(r'\s+', ' ', title).strip().title()
+        return ' '.join(title.split()).title()
 
     @staticmethod
     def _error_doc(file_path: Path, error: str, title: str = None) -> Dict[str, Any]:
@@ -139,19 +134,30 @@ class FileProcessor:
 
     @staticmethod
     def extract_from_pdf(file_path: Path) -> str:
+        fitz = _lazy("fitz")  # PyMuPDF
         if fitz is None:
             return "[PDF support not installed]"
+        # Expand ligatures at extraction time; keep whitespace so paragraph
+        # breaks survive for the chunker
+        flags = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+        buffer = io.StringIO()
         with fitz.open(file_path) as pdf:
-            return " ".join(page.get_text() for page in pdf)
+            for page_number, page in enumerate(pdf):
+                if page_number:
+                    buffer.write(" ")
+                buffer.write(page.get_text("text", flags=flags))
+        return buffer.getvalue()
 
     @staticmethod
     def extract_from_docx(file_path: Path) -> str:
+        docx = _lazy("docx")
         if docx is None:
             return "[DOCX support not installed]"
         return "\n".join(p.text for p in docx.Document(file_path).paragraphs)
 
     @staticmethod
     def extract_from_doc(file_path: Path) -> str:
+        textract = _lazy("textract")
         if textract is None:
             return "[DOC support not installed]"
         return textract.process(str(file_path)).decode()
@@ -159,50 +165,70 @@ class FileProcessor:
     @staticmethod
     def extract_from_txt(file_path: Path) -> str:
         encodings = ['utf-8', 'latin-1', 'cp1252']
-        for enc in encodings:
-            try:
-                with open(file_path, 'r', encoding=enc) as f:
-                    return f.read()
-            except UnicodeDecodeError:
-                continue
-        return open(file_path, 'rb').read().decode('utf-8', errors='replace')
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            # Decode straight from the mapped pages instead of reading a copy first
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for enc in encodings:
+                    try:
+                        text = str(mm, enc)
+                        break
+                    except UnicodeDecodeError:
+                        continue
+                else:
+                    text = str(mm, 'utf-8', errors='replace')
+
+        # Match text-mode reads, which translate Windows/Mac line endings
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
 
     @staticmethod
     def extract_from_markdown(file_path: Path) -> str:
         with open(file_path, 'r', encoding='utf-8') as f:
-            md_text = f.read()
-        if not markdown_available:
-            return md_text
-        html = markdown.markdown(md_text)
-        return BeautifulSoup(html, 'html.parser').get_text()
+            return _strip_markdown(f.read())
 
     @staticmethod
     def extract_from_csv(file_path: Path) -> str:
+        pd = _lazy("pandas")
         if pd is None:
             return "[Pandas not installed for CSV processing]"
-        return pd.read_csv(file_path).to_string(index=False)
+        # Read cells as raw strings and let the C CSV writer lay them out;
+        # tab-separated so cells containing spaces are not quoted
+        df = pd.read_csv(file_path, dtype=str, na_filter=False)
+        return df.to_csv(None, sep='\t', index=False, header=True)
 
     @staticmethod
     def extract_from_excel(file_path: Path) -> str:
+        pd = _lazy("pandas")
         if pd is None:
             return "[Pandas not installed for Excel processing]"
-        return pd.read_excel(file_path).to_string(index=False)
+        df = pd.read_excel(file_path, dtype=str, na_filter=False)
+        return df.to_csv(None, sep='\t', index=False, header=True)
 
     @staticmethod
     def extract_from_pptx(file_path: Path) -> str:
-        if Presentation is None:
+        pptx = _lazy("pptx")
+        if pptx is None:
             return "[PPTX support not installed]"
-        prs = Presentation(file_path)
-        return " ".join(shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text"))
+        prs = pptx.Presentation(file_path)
+        texts = [getattr(shape, "text", "") for slide in prs.slides for shape in slide.shapes]
+        return " ".join([text for text in texts if text])
 
     @staticmethod
     def extract_from_html(file_path: Path) -> str:
+        bs4 = _lazy("bs4")
         with open(file_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
+            html = f.read()
+        if bs4 is None:
+            return html
+        soup = bs4.BeautifulSoup(html, 'html.parser')
         return soup.get_text()
 
     @staticmethod
     def extract_from_msg(file_path: Path) -> str:
+        extract_msg = _lazy("extract_msg")
         if extract_msg is None:
             return "[MSG support not installed]"
         msg = extract_msg.Message(str(file_path))
@@ -210,6 +236,28 @@ class FileProcessor:
 
     @staticmethod
     def extract_from_image(file_path: Path) -> str:
+        Image = _lazy("PIL.Image")
+        pytesseract = _lazy("pytesseract")
         if Image is None or pytesseract is None:
             return "[OCR support not installed]"
-        return pytesseract.image_to_string(Image.open(file_path))
\ No newline at end of file
+        return pytesseract.image_to_string(Image.open(file_path))
+
+
+# Extension -> extractor dispatch table, built once at import
+FileProcessor._HANDLERS = {
+    '.pdf': FileProcessor.extract_from_pdf,
+    '.docx': FileProcessor.extract_from_docx,
+    '.doc': FileProcessor.extract_from_doc,
+    '.txt': FileProcessor.extract_from_txt,
+    '.md': FileProcessor.extract_from_markdown,
+    '.csv': FileProcessor.extract_from_csv,
+    '.xls': FileProcessor.extract_from_excel,
+    '.xlsx': FileProcessor.extract_from_excel,
+    '.pptx': FileProcessor.extract_from_pptx,
+    '.html': FileProcessor.extract_from_html,
+    '.htm': FileProcessor.extract_from_html,
+    '.msg': FileProcessor.extract_from_msg,
+    '.jpg': FileProcessor.extract_from_image,
+    '.jpeg': FileProcessor.extract_from_image,
+    '.png': FileProcessor.extract_from_image
+}
@@ -2,11 +2,38 @@
 Split documents into chunks for embedding and retrieval.
 """
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from ..utils.logger import get_logger
 
+# google-re2 (DFA, linear time) for the sentence-end scan when installed
+try:
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
+
+# Compiled paragraph packer, present when built with Cython (see setup.py)
+try:
+    from ._text_chunker_fast import pack_paragraphs as _pack_paragraphs_fast
+except ImportError:
+    _pack_paragraphs_fast = None
+
 logger = get_logger(__name__)
 
+_SENT_END_RE = _re_engine.compile(r'[.!?]\s+')  # Sentence-ending punctuation followed by whitespace
+
+
+def _collapse_whitespace(para: str) -> str:
+    """Collapse whitespace runs to single spaces and trim the ends."""
+    # Fast path: ASCII text whose only whitespace is single spaces needs just
+    # a strip. Each `in` is a C substring scan; these are every ASCII char
+    # str.split() treats as whitespace apart from the space itself.
+    if (para.isascii() and '  ' not in para and '\n' not in para and '\t' not in para
+            and '\r' not in para and '\x0b' not in para and '\x0c' not in para
+            and '\x1c' not in para and '\x1d' not in para and '\x1e' not in para and '\x1f' not in para):
+        return para.strip()
+    return ' '.join(para.split())
+
+
 class TextChunker:
     """Split documents into chunks for embedding and retrieval."""
     
@@ -22,6 +49,12 @@ class TextChunker:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.include_overlap_in_chunk = include_overlap_in_chunk
+
+        # Pick the split routine once rather than branching on every document
+        if include_overlap_in_chunk and chunk_overlap > 0:
+            self._split_text = self._split_text_with_overlap
+        else:
+            self._split_text = self._split_text_no_overlap
     
     def chunk_document(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -53,48 +86,85 @@ class TextChunker:
         logger.info(f"Split document '{title}' into {len(document_chunks)} chunks")
         return document_chunks
     
-    def _split_text(self, text: str) -> List[str]:
+    @staticmethod
+    def _iter_paragraphs(text: str) -> Iterator[str]:
+        """
+        Lazily yield the non-empty, whitespace-collapsed paragraphs of text,
+        so a large document never has its full paragraph list in memory.
+        """
+        pos = 0
+        while True:
+            end = text.find('\n\n', pos)
+            para = _collapse_whitespace(text[pos:] if end == -1 else text[pos:end])
+            if para:
+                yield para
+            if end == -1:
+                return
+            pos = end + 2
+
+    def _split_text_with_overlap(self, text: str) -> List[str]:
+        """
+        Split text into paragraph-aware chunks, each after the first prefixed
+        with the tail of the chunk before it.
         """
-        Split text into chunks with paragraph-awareness and optional overlap.
+        paragraphs = self._iter_paragraphs(text)
+        if _pack_paragraphs_fast is not None:
+            return _pack_paragraphs_fast(paragraphs, self.chunk_size, self.chunk_overlap, True)
+        return self._pack_paragraphs(paragraphs, True)
+
+    def _split_text_no_overlap(self, text: str) -> List[str]:
+        """
+        Split text into paragraph-aware chunks without prepending overlap.
         """
-        # Step 1: Paragraph split first (retain structure)
-        paragraphs = text.split('\n\n')
-        paragraphs = [re.sub(r'\s+', ' ', para).strip() for para in paragraphs if para.strip()]
+        paragraphs = self._iter_paragraphs(text)
+        if _pack_paragraphs_fast is not None:
+            return _pack_paragraphs_fast(paragraphs, self.chunk_size, self.chunk_overlap, False)
+        return self._pack_paragraphs(paragraphs, False)
 
+    def _pack_paragraphs(self, paragraphs: Iterable[str], include_overlap: bool) -> List[str]:
+        """
+        Greedily pack paragraphs into chunks of at most chunk_size characters,
+        force-splitting any paragraph that is longer on its own. With
+        include_overlap, each chunk after the first is prefixed with the last
+        chunk_overlap characters of the chunk before it.
+        """
         chunks = []
-        current_chunk = ""
+        prev_chunk = None
+        buf = []  # Paragraphs of the chunk being built, joined once on flush
+        cur_len = 0
+
+        def emit(chunk: str):
+            nonlocal prev_chunk
+            # Chunks are stripped, so only the start of a borrowed tail can carry whitespace
+            if include_overlap and prev_chunk is not None:
+                chunks.append(prev_chunk[-self.chunk_overlap:].lstrip() + chunk)
+            else:
+                chunks.append(chunk)
+            prev_chunk = chunk
 
         for para in paragraphs:
-            if len(current_chunk) + len(para) + 2 <= self.chunk_size:
-                current_chunk += para + "\n\n"
+            if cur_len + len(para) + 2 <= self.chunk_size:
+                buf.append(para)
+                cur_len += len(para) + 2
             else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
+                if buf:
+                    emit("\n\n".join(buf))
+                buf.clear()
+                cur_len = 0
 
                 if len(para) > self.chunk_size:
                     logger.warning(f"Oversized paragraph of length {len(para)} – will be force-split.")
                     for i in range(0, len(para), self.chunk_size - self.chunk_overlap):
-                        sub_chunk = para[i:i + self.chunk_size]
-                        chunks.append(sub_chunk.strip())
-                    current_chunk = ""
+                        emit(para[i:i + self.chunk_size].strip())
                 else:
-                    current_chunk = para + "\n\n"
+                    buf.append(para)
+                    cur_len = len(para) + 2
 
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-
-        # Step 2: Overlap logic
-        final_chunks = []
-        for i, chunk in enumerate(chunks):
-            if i > 0 and self.chunk_overlap > 0:
-                overlap = chunks[i - 1][-self.chunk_overlap:]
-                chunk = overlap + chunk if self.include_overlap_in_chunk else chunk
-            final_chunks.append(chunk.strip())
-
-        return final_chunks
+        if buf:
+            emit("\n\n".join(buf))
 
+        return chunks
 
-        
     def _find_sentence_boundary(self, text: str, position: int) -> int:
         """
         Find the nearest sentence boundary after the given position.
@@ -106,16 +176,13 @@ class TextChunker:
         Returns:
             Position of the nearest sentence boundary
         """
-        # Look for sentence-ending punctuation followed by space or end of text
-        sentence_end_pattern = r'[.!?]\s+'
-        
-        # Search for the pattern after the position
-        search_text = text[position:min(position + 100, len(text))]
-        match = re.search(sentence_end_pattern, search_text)
+        # Search for sentence-ending punctuation in the next 100 characters,
+        # scanning text in place rather than copying the window out
+        match = _SENT_END_RE.search(text, position, position + 100)
         
         if match:
             # Return the position of the end of the sentence
-            return position + match.end()
+            return match.end()
         
         # If no sentence boundary found, look for other boundaries
         # Try paragraph break
@@ -2,25 +2,42 @@
 End-to-end training pipeline for document processing with production-grade enhancements.
 """
 import os
-import glob
 import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 import multiprocessing
+import queue
+import threading
 import traceback
 
+import faiss
+
 from ..utils.logger import get_logger
 from ..config import RAW_DIR, PROCESSED_DIR
-from ..database.models import DocumentModel
-from ..database.vector_store import VectorStore
+from ..core.resources import GlobalResources
 from .file_processor import FileProcessor
 from .text_chunker import TextChunker
 from .embedding_generator import EmbeddingGenerator
 
 logger = get_logger(__name__)
 
+_worker_chunker: Optional[TextChunker] = None
+
+
+def _init_chunk_worker(chunk_size: int, chunk_overlap: int):
+    """Build one TextChunker per worker process."""
+    global _worker_chunker
+    _worker_chunker = TextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _parse_and_chunk(file_path: Path) -> List[Dict[str, Any]]:
+    """Extract and chunk one file inside a worker process."""
+    document = FileProcessor.process_file(file_path)
+    return _worker_chunker.chunk_document(document)
+
+
 class DocumentProcessingException(Exception):
     """Custom exception for document processing errors."""
     pass
@@ -28,6 +45,12 @@ class DocumentProcessingException(Exception):
 class TrainingPipeline:
     """End-to-end pipeline for processing documents and generating embeddings."""
 
+    WRITE_QUEUE_SIZE = 32  # Embedded batches allowed to wait for the writer thread
+    EMBED_QUEUE_SIZE = 64  # Chunked files allowed to wait for the embedding thread
+    EMBED_BATCH_SIZE = 256  # Chunks gathered across files per generate_embeddings call
+    EMBED_BATCH_TIMEOUT = 0.5  # Seconds to wait for more chunks before embedding a partial batch
+    STAGE_QUEUE_SIZE = 2  # Batches buffered between process_file's pipeline stages
+
     def __init__(self,
                  chunk_size: int = 1200,
                  chunk_overlap: int = 300,
@@ -39,12 +62,12 @@ class TrainingPipeline:
         self.max_workers = max_workers or max(1, available_cores // 2)
         self.batch_size = batch_size
 
-        logger.info(f"Using {self.max_workers} worker threads (out of {available_cores} available cores)")
+        logger.info(f"Using {self.max_workers} worker processes (out of {available_cores} available cores)")
 
         self.chunker = TextChunker(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
         self.embedding_generator = EmbeddingGenerator()
-        self.doc_model = DocumentModel()
-        self.vector_store = VectorStore()
+        self.doc_model = GlobalResources.get_document_model()
+        self.vector_store = GlobalResources.get_vector_store()
 
     def _is_valid_file(self, file_path: Path) -> bool:
         if file_path.stat().st_size == 0:
@@ -67,38 +90,78 @@ class TrainingPipeline:
         try:
             os.makedirs(directory, exist_ok=True)
             os.makedirs(PROCESSED_DIR, exist_ok=True)
-            supported_extensions = ['.pdf', '.docx', '.txt', '.md']
-            files = [Path(file) for ext in supported_extensions for file in glob.glob(str(directory / f"*{ext}"))]
-            if not files:
+            supported_extensions = ('.pdf', '.docx', '.txt', '.md')
+            # One scandir pass per directory; DirEntry caches its stat result
+            with os.scandir(directory) as it:
+                entries = [e for e in it if e.is_file() and e.name.lower().endswith(supported_extensions)]
+            if not entries:
                 logger.warning(f"No supported files found in {directory}")
                 return 0
 
+            with os.scandir(PROCESSED_DIR) as it:
+                marker_mtimes = {e.name: e.stat().st_mtime for e in it if e.is_file()}
+
             files_to_process = []
-            for file in files:
-                if not self._is_valid_file(file):
+            for entry in entries:
+                stat = entry.stat()
+                if stat.st_size == 0:
+                    logger.warning(f"Skipping empty file: {entry.name}")
                     continue
-                processed_marker = PROCESSED_DIR / file.name
-                if not force_reprocess and processed_marker.exists():
-                    if os.path.getmtime(file) <= os.path.getmtime(processed_marker):
-                        logger.info(f"Skipping {file.name} - already processed")
-                        continue
-                files_to_process.append(file)
+                marker_mtime = marker_mtimes.get(entry.name)
+                if not force_reprocess and marker_mtime is not None and stat.st_mtime <= marker_mtime:
+                    logger.info(f"Skipping {entry.name} - already processed")
+                    continue
+                files_to_process.append((stat.st_size, Path(entry.path)))
 
             if not files_to_process:
                 logger.info(f"No files need processing in {directory}")
                 return 0
 
+            # Largest files first so a big PDF never starts last and holds up the pool
+            files_to_process.sort(key=lambda item: item[0], reverse=True)
+            files_to_process = [path for _, path in files_to_process]
+
+            # Worker processes parse and chunk (CPU-bound, so they sidestep the
+            # GIL); one embedding thread gathers chunks across files into large
+            # batches; a single writer thread owns every SQLite and FAISS write
+            embed_queue = queue.Queue(maxsize=self.EMBED_QUEUE_SIZE)
+            write_queue = queue.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+            completed_files = []  # (file, chunks, embeddings), marked only after the final flush
+            embedder = threading.Thread(target=self._embed_worker, args=(embed_queue, write_queue), daemon=True)
+            writer = threading.Thread(target=self._write_worker, args=(write_queue, completed_files), daemon=True)
+
             processed_count = 0
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = {executor.submit(self.process_file, file): file for file in files_to_process}
-                for future in tqdm(as_completed(futures), total=len(futures), desc="Processing files"):
-                    file = futures[future]
-                    try:
-                        result = future.result()
-                        processed_count += result
-                    except Exception as e:
-                        logger.error(f"Failed to process {file.name}: {e}\n{traceback.format_exc()}")
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_workers,
+                                         initializer=_init_chunk_worker,
+                                         initargs=(self.chunk_size, self.chunk_overlap)) as executor:
+                    # Submit (and so fork the workers) before starting our own threads
+                    futures = {executor.submit(_parse_and_chunk, file): file for file in files_to_process}
+                    embedder.start()
+                    writer.start()
+                    for future in tqdm(as_completed(futures), total=len(futures), desc="Processing files"):
+                        file = futures[future]
+                        try:
+                            document_chunks = future.result()
+                            embed_queue.put(("chunks", file, document_chunks))
+                            embed_queue.put(("done", file, len(document_chunks)))
+                            processed_count += len(document_chunks)
+                        except Exception as e:
+                            logger.error(f"Failed to process {file.name}: {e}\n{traceback.format_exc()}")
+            finally:
+                if embedder.is_alive():
+                    embed_queue.put(None)
+                    embedder.join()
+                if writer.is_alive():
+                    write_queue.put(None)
+                    writer.join()
 
+            # Mark files processed only once their vectors are on disk, so a
+            # crash before the flush leaves them to be ingested again
+            self.vector_store.flush()
+            for file_path, total_chunks, total_embeddings in completed_files:
+                self._write_processed_marker(file_path, total_chunks, total_embeddings)
+                logger.info(f"Processed {file_path.name}: {total_chunks} chunks, {total_embeddings} embeddings")
             logger.info(f"Successfully processed {processed_count} documents")
             return processed_count
 
@@ -115,38 +178,8 @@ class TrainingPipeline:
             document_chunks = self.chunker.chunk_document(document)
 
             total_chunks = len(document_chunks)
-            processed_chunks = 0
-            total_embeddings = 0
-
-            for i in range(0, total_chunks, self.batch_size):
-                batch = document_chunks[i:i+self.batch_size]
-                chunk_ids = []
-
-                for chunk in batch:
-                    try:
-                        chunk_id = self.doc_model.save_document(
-                            title=chunk["title"],
-                            content=chunk["content"],
-                            source_file=chunk["source_file"],
-                            chunk_index=chunk["chunk_index"]
-                        )
-                        chunk["id"] = chunk_id
-                        chunk_ids.append(chunk_id)
-                    except Exception as db_error:
-                        logger.warning(f"Database write failed for chunk: {db_error}")
-                        continue
-
-                if not chunk_ids:
-                    continue
-
-                try:
-                    embedding_result = self.embedding_generator.generate_embeddings(batch)
-                    embeddings = embedding_result["embeddings"]
-                    self.vector_store.add_documents(batch, embeddings)
-                    total_embeddings += len(embeddings)
-                    processed_chunks += len(batch)
-                except Exception as embed_error:
-                    logger.error(f"Embedding error: {embed_error}\n{traceback.format_exc()}")
+            total_embeddings = self._run_file_stages(document_chunks)
+            self.vector_store.flush()
 
             self._write_processed_marker(file_path, total_chunks, total_embeddings)
             logger.info(f"Processed {file_path.name}: {total_chunks} chunks, {total_embeddings} embeddings")
@@ -156,6 +189,178 @@ class TrainingPipeline:
             logger.error(f"Unhandled error in process_file: {e}\n{traceback.format_exc()}")
             return 0
 
+    def _run_file_stages(self, document_chunks: List[Dict[str, Any]]) -> int:
+        """
+        Embed, save to SQLite and add to the vector store as three overlapped
+        stages: this thread embeds batch n while a DB thread saves batch n-1
+        and an index thread adds batch n-2. Returns the embeddings indexed;
+        raises RuntimeError if the vector store rejected a batch.
+        """
+        db_queue = queue.Queue(maxsize=self.STAGE_QUEUE_SIZE)
+        index_queue = queue.Queue(maxsize=self.STAGE_QUEUE_SIZE)
+        failed = threading.Event()
+        indexed = [0]
+
+        def db_writer():
+            # Stops saving once indexing fails but keeps draining, like the indexer
+            while True:
+                item = db_queue.get()
+                if item is None:
+                    index_queue.put(None)
+                    return
+                if failed.is_set():
+                    continue
+                batch, embeddings = item
+                if self._save_batch(batch):
+                    index_queue.put((batch, embeddings))
+
+        def indexer():
+            # Keeps draining after a failure so upstream stages never block
+            while True:
+                item = index_queue.get()
+                if item is None:
+                    return
+                if failed.is_set():
+                    continue
+                batch, embeddings = item
+                # add_documents logs its own errors and reports them as False
+                if self.vector_store.add_documents(batch, embeddings):
+                    indexed[0] += len(embeddings)
+                else:
+                    failed.set()
+
+        stages = [threading.Thread(target=db_writer, daemon=True), threading.Thread(target=indexer, daemon=True)]
+        for stage in stages:
+            stage.start()
+        try:
+            for batch, embeddings in self._embed_batches(document_chunks):
+                if failed.is_set():
+                    break
+                db_queue.put((batch, embeddings))
+        finally:
+            db_queue.put(None)
+            for stage in stages:
+                stage.join()
+
+        if failed.is_set():
+            raise RuntimeError(f"Vector store add failed after indexing {indexed[0]} embeddings")
+        return indexed[0]
+
+    def _embed_worker(self, embed_queue: queue.Queue, write_queue: queue.Queue):
+        """
+        Embed chunks from every file in shared batches of up to EMBED_BATCH_SIZE,
+        then route each file's slice of the result to the writer thread.
+        """
+        pending = []  # (file_path, chunks) segments in arrival order
+        pending_count = 0
+        held_done = []  # "done" markers wait until their file's chunks are written
+
+        def flush():
+            nonlocal pending_count
+            if pending:
+                batch = [chunk for _, chunks in pending for chunk in chunks]
+                try:
+                    embeddings = self.embedding_generator.generate_embeddings(batch)["embeddings"]
+                except Exception as embed_error:
+                    logger.error(f"Embedding error: {embed_error}\n{traceback.format_exc()}")
+                else:
+                    offset = 0
+                    for file_path, chunks in pending:
+                        write_queue.put(("batch", file_path, chunks, embeddings[offset:offset + len(chunks)]))
+                        offset += len(chunks)
+                pending.clear()
+                pending_count = 0
+            for file_path, total_chunks in held_done:
+                write_queue.put(("done", file_path, total_chunks, None))
+            held_done.clear()
+
+        while True:
+            try:
+                item = embed_queue.get(timeout=self.EMBED_BATCH_TIMEOUT)
+            except queue.Empty:
+                flush()
+                continue
+            if item is None:
+                break
+
+            kind, file_path, payload = item
+            if kind == "chunks":
+                if payload:
+                    pending.append((file_path, payload))
+                    pending_count += len(payload)
+            else:
+                held_done.append((file_path, payload))
+
+            if pending_count >= self.EMBED_BATCH_SIZE:
+                flush()
+
+        flush()
+
+    def _embed_batches(self, document_chunks: List[Dict[str, Any]]):
+        """Yield (batch, embeddings) pairs, skipping batches that fail to embed."""
+        for i in range(0, len(document_chunks), self.batch_size):
+            batch = document_chunks[i:i+self.batch_size]
+            try:
+                embedding_result = self.embedding_generator.generate_embeddings(batch)
+            except Exception as embed_error:
+                logger.error(f"Embedding error: {embed_error}\n{traceback.format_exc()}")
+                continue
+            yield batch, embedding_result["embeddings"]
+
+    def _save_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        """Save a batch to SQLite and tag each chunk with its row ID; False if the write failed."""
+        try:
+            chunk_ids = self.doc_model.save_documents(batch)
+        except Exception as db_error:
+            logger.warning(f"Database write failed for batch: {db_error}")
+            return False
+
+        for chunk, chunk_id in zip(batch, chunk_ids):
+            chunk["id"] = chunk_id
+        return True
+
+    def _write_batch(self, batch: List[Dict[str, Any]], embeddings) -> int:
+        """Save a batch to SQLite and the vector store; returns the embeddings written."""
+        if not self._save_batch(batch):
+            return 0
+        if not self.vector_store.add_documents(batch, embeddings):
+            return 0
+        return len(embeddings)
+
+    def _write_worker(self, write_queue: queue.Queue, completed_files: List[tuple]):
+        """
+        Consume embedded batches until a None sentinel arrives. Files whose
+        batches were all written are appended to completed_files; files with a
+        failed batch are left unmarked so the next run retries them.
+        """
+        # Keep FAISS from competing with the embedding threads for cores
+        faiss.omp_set_num_threads(1)
+        embeddings_per_file = {}
+        failed_files = set()
+
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+
+            kind, file_path, payload, embeddings = item
+            try:
+                if kind == "batch":
+                    written = self._write_batch(payload, embeddings)
+                    if written < len(embeddings):
+                        failed_files.add(file_path)
+                    embeddings_per_file[file_path] = embeddings_per_file.get(file_path, 0) + written
+                else:
+                    total_embeddings = embeddings_per_file.pop(file_path, 0)
+                    if file_path in failed_files:
+                        failed_files.discard(file_path)
+                        logger.warning(f"Not marking {file_path.name} processed; some batches failed to write")
+                    else:
+                        completed_files.append((file_path, payload, total_embeddings))
+            except Exception as e:
+                failed_files.add(file_path)
+                logger.error(f"Writer failed on {file_path.name}: {e}\n{traceback.format_exc()}")
+
     def process_hr_files(self, hr_files_dir: Path, force_reprocess: bool = False) -> int:
         if not os.path.exists(hr_files_dir):
             logger.error(f"HR files directory not found: {hr_files_dir}")
@@ -1,56 +1,144 @@
 """
 Document version control and re-indexing.
 """
+import os
+import re
 import hashlib
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from concurrent.futures import ThreadPoolExecutor
 import shutil
 
 from ..utils.logger import get_logger
 from ..config import DATA_DIR, RAW_DIR, PROCESSED_DIR
 from .embedding_generator import EmbeddingGenerator
-from ..database.vector_store import VectorStore
+from ..core.resources import GlobalResources
 
 logger = get_logger(__name__)
 
+_BACKUP_NAME_RE = re.compile(r"^(?P<name>.+)_(?P<timestamp>\d{8}_\d{6})$")
+HASH_READ_SIZE = 1 << 20  # 1 MiB reads for the pre-3.11 hashing loop
+
+
+def _new_sha256():
+    """OpenSSL-backed SHA-256 flagged as non-security use (change detection only)."""
+    try:
+        return hashlib.new("sha256", usedforsecurity=False)
+    except TypeError:  # Python < 3.9 has no usedforsecurity
+        return hashlib.sha256()
+
+
 class DocumentVersionControl:
     """Manage document versions and re-indexing."""
 
     def __init__(self):
         """Initialize document version control."""
-        self.versions_file = DATA_DIR / "document_versions.json"
+        self.versions_file = DATA_DIR / "document_versions.jsonl"
+        self._log_entries = 0  # Lines in the append-only log, live or superseded
         self.versions = self._load_versions()
+        self._hash_cache: Dict[str, Tuple[int, int, str]] = {}  # path -> (mtime_ns, size, hash)
         self.embedding_generator = EmbeddingGenerator()
-        self.vector_store = VectorStore()
+        self.vector_store = GlobalResources.get_vector_store()
 
     def _load_versions(self) -> Dict[str, Any]:
-        """Load document versions from file."""
+        """Replay the version log; the last record per file wins."""
+        versions = {}
         if self.versions_file.exists():
             try:
                 with open(self.versions_file, 'r') as f:
-                    return json.load(f)
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            logger.warning("Skipping malformed line in version log")  # e.g. torn final write
+                            continue
+                        versions[record.pop("file")] = record
+                        self._log_entries += 1
             except Exception as e:
                 logger.error(f"Error loading versions: {e}")
-        return {}
+            return versions
 
-    def _save_versions(self):
-        """Save document versions to file."""
+        # One-time migration from the old whole-file JSON format
+        legacy_file = DATA_DIR / "document_versions.json"
+        if legacy_file.exists():
+            try:
+                with open(legacy_file, 'r') as f:
+                    versions = json.load(f)
+                self.versions = versions
+                self.compact()
+            except Exception as e:
+                logger.error(f"Error migrating versions: {e}")
+        return versions
+
+    def _save_version(self, file_name: str):
+        """Append the current record for one file to the version log."""
         try:
-            with open(self.versions_file, 'w') as f:
-                json.dump(self.versions, f, indent=2)
+            with open(self.versions_file, 'a') as f:
+                f.write(json.dumps({"file": file_name, **self.versions[file_name]}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_entries += 1
+            if self._log_entries > 2 * len(self.versions):
+                self.compact()
         except Exception as e:
             logger.error(f"Error saving versions: {e}")
 
+    def compact(self):
+        """Rewrite the log with one line per file, atomically replacing the old one."""
+        tmp_file = self.versions_file.with_suffix(".jsonl.tmp")
+        with open(tmp_file, 'w') as f:
+            for file_name, record in self.versions.items():
+                f.write(json.dumps({"file": file_name, **record}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.versions_file)
+        self._log_entries = len(self.versions)
+
     def _calculate_hash(self, file_path: Path) -> str:
         """Calculate SHA-256 hash of a file."""
-        sha256_hash = hashlib.sha256()
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+: read/update loop runs in C
+                return hashlib.file_digest(f, _new_sha256).hexdigest()
+            sha256_hash = _new_sha256()
+            for byte_block in iter(lambda: f.read(HASH_READ_SIZE), b""):
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
 
+    def _hash_for(self, file_path: Path, stat: os.stat_result) -> str:
+        """Hash a file, reusing the last digest if it has not changed since."""
+        cached = self._hash_cache.get(str(file_path))
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        file_hash = self._calculate_hash(file_path)
+        self._hash_cache[str(file_path)] = (stat.st_mtime_ns, stat.st_size, file_hash)
+        return file_hash
+
+    def _check(self, file_path: Path) -> Tuple[bool, Optional[str], os.stat_result]:
+        """
+        Return (needs re-indexing, content hash if one was computed, stat).
+
+        A file whose mtime and size match the stored record is treated as
+        unchanged without being read.
+        """
+        stat = file_path.stat()
+        record = self.versions.get(file_path.name)
+        if record and record.get("mtime_ns") == stat.st_mtime_ns and record.get("size") == stat.st_size:
+            return False, None, stat
+
+        file_hash = self._hash_for(file_path, stat)
+        if not record or record["hash"] != file_hash:
+            return True, file_hash, stat
+
+        # Touched but identical: remember the new mtime so the next check skips hashing
+        record["mtime_ns"] = stat.st_mtime_ns
+        record["size"] = stat.st_size
+        self._save_version(file_path.name)
+        return False, file_hash, stat
+
     def check_version(self, file_path: Path) -> bool:
         """
         Check if a file needs to be re-indexed.
@@ -62,42 +150,77 @@ class DocumentVersionControl:
             True if file needs re-indexing
         """
         try:
-            file_hash = self._calculate_hash(file_path)
-            file_name = file_path.name
-            
-            if file_name not in self.versions:
-                return True
-            
-            current_version = self.versions[file_name]
-            if current_version["hash"] != file_hash:
-                return True
-            
-            return False
+            return self._check(file_path)[0]
             
         except Exception as e:
             logger.error(f"Error checking version: {e}")
             return True
 
-    def update_version(self, file_path: Path, metadata: Dict[str, Any] = None):
+    def check_versions_bulk(self, paths: Iterable[Path]) -> Dict[Path, bool]:
+        """
+        Check many files at once, hashing the ones that need it in parallel.
+
+        hashlib releases the GIL while digesting, so threads hash on separate
+        cores; the comparisons against self.versions stay on this thread.
+
+        Returns:
+            Mapping of path -> True if the file needs re-indexing
+        """
+        results = {}
+        to_hash = []
+        for path in map(Path, paths):
+            try:
+                stat = path.stat()
+            except OSError as e:
+                logger.error(f"Error checking version: {e}")
+                results[path] = True
+                continue
+            record = self.versions.get(path.name)
+            if record and record.get("mtime_ns") == stat.st_mtime_ns and record.get("size") == stat.st_size:
+                results[path] = False
+            else:
+                to_hash.append((path, stat))
+
+        if len(to_hash) > 1:
+            def warm(item):
+                try:
+                    self._hash_for(*item)
+                except OSError:
+                    pass  # Reported by check_version below
+
+            with ThreadPoolExecutor(max_workers=min(len(to_hash), os.cpu_count() or 1)) as executor:
+                list(executor.map(warm, to_hash))
+
+        for path, _ in to_hash:
+            results[path] = self.check_version(path)
+        return results
+
+    def update_version(self, file_path: Path, metadata: Dict[str, Any] = None,
+                       file_hash: Optional[str] = None, stat: Optional[os.stat_result] = None):
         """
         Update version information for a file.
         
         Args:
             file_path: Path to the file
             metadata: Additional metadata
+            file_hash: Hash already computed for the file, to avoid re-reading it
+            stat: stat result the hash was computed against
         """
         try:
             file_name = file_path.name
-            file_hash = self._calculate_hash(file_path)
+            if file_hash is None or stat is None:
+                stat = file_path.stat()
+                file_hash = self._calculate_hash(file_path)
             
             self.versions[file_name] = {
                 "hash": file_hash,
                 "last_modified": datetime.now().isoformat(),
-                "size": file_path.stat().st_size,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
                 "metadata": metadata or {}
             }
             
-            self._save_versions()
+            self._save_version(file_name)
             logger.info(f"Updated version for {file_name}")
             
         except Exception as e:
@@ -134,7 +257,8 @@ class DocumentVersionControl:
             True if re-indexing was successful
         """
         try:
-            if not self.check_version(file_path):
+            needs_reindex, file_hash, stat = self._check(file_path)
+            if not needs_reindex:
                 logger.info(f"No re-indexing needed for {file_path.name}")
                 return True
             
@@ -146,9 +270,10 @@ class DocumentVersionControl:
                 documents=[{"content": doc["content"], "source_file": str(file_path), "chunk_index": i} for i, doc in enumerate(embeddings)],
                 vectors=embeddings
             )
+            self.vector_store.flush()
             
-            # Update version information
-            self.update_version(file_path)
+            # Update version information, reusing the hash from the check
+            self.update_version(file_path, file_hash=file_hash, stat=stat)
             
             logger.info(f"Successfully re-indexed {file_path.name}")
             return True
@@ -174,7 +299,8 @@ class DocumentVersionControl:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_path = backup_dir / f"{file_path.stem}_{timestamp}{file_path.suffix}"
             
-            shutil.copy2(file_path, backup_path)
+            # Data only (copy_file_range/sendfile in-kernel); the timestamp lives in the name
+            shutil.copyfile(file_path, backup_path)
             logger.info(f"Created backup at {backup_path}")
             
             return backup_path
@@ -195,7 +321,8 @@ class DocumentVersionControl:
             True if restore was successful
         """
         try:
-            shutil.copy2(backup_path, target_path)
+            # A fresh mtime also keeps the version check's mtime/size fast path honest
+            shutil.copyfile(backup_path, target_path)
             logger.info(f"Restored document from {backup_path}")
             
             # Re-index the restored document
@@ -217,19 +344,23 @@ class DocumentVersionControl:
             if not backup_dir.exists():
                 return
             
-            # Group backups by original filename
+            # Group backups by original file; backup_document names them
+            # <stem>_<YYYYmmdd_HHMMSS><suffix>, so the timestamp sorts chronologically
             backups = {}
-            for backup in backup_dir.glob("*"):
-                original_name = "_".join(backup.stem.split("_")[:-1])
-                if original_name not in backups:
-                    backups[original_name] = []
-                backups[original_name].append(backup)
+            with os.scandir(backup_dir) as it:
+                for entry in it:
+                    stem, suffix = os.path.splitext(entry.name)
+                    match = _BACKUP_NAME_RE.match(stem)
+                    if not match or not entry.is_file():
+                        continue
+                    key = (match.group("name"), suffix)
+                    backups.setdefault(key, []).append((match.group("timestamp"), entry.path))
             
             # Keep only the most recent versions
-            for original_name, version_files in backups.items():
-                version_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-                for old_version in version_files[max_versions:]:
-                    old_version.unlink()
+            for version_files in backups.values():
+                version_files.sort(reverse=True)
+                for _, old_version in version_files[max_versions:]:
+                    os.unlink(old_version)
                     logger.info(f"Removed old version: {old_version}")
                     
         except Exception as e:
@@ -1,18 +1,29 @@
 import json
 import os
+import queue
 import re
 import threading
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, Tuple, List
 
 import numpy as np
 import torch
 import torch.nn as nn
-from sentence_transformers import SentenceTransformer
+from torch.utils.data import DataLoader, TensorDataset
 from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import train_test_split
-from rapidfuzz import fuzz
-from scipy.stats import entropy
+from rapidfuzz import fuzz, process
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from ..utils.logger import get_logger
 from ..config import DATA_DIR
@@ -21,12 +32,77 @@ logger = get_logger(__name__)
 
 INTENTS_CONFIG_PATH = DATA_DIR / "config" / "intents.json"
 TRAINING_DATA_PATH = DATA_DIR / "training" / "intent_training_data.jsonl"
+# Row i embeds line i of the append-only training JSONL
+TRAINING_EMBEDDINGS_PATH = DATA_DIR / "training" / "intent_training_embeddings.npy"
 MODEL_DIR = DATA_DIR / "models"
 MODEL_PATH = MODEL_DIR / "intent_classifier.pth"
 ENCODER_PATH = MODEL_DIR / "label_encoder.joblib"
+EMBEDDER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDER_ONNX_DIR = MODEL_DIR / "minilm_onnx"
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+CLASSIFY_CACHE_SIZE = 1024
+CLASSIFY_TEMPERATURE = 2.0  # More cautious softmax
+TRAIN_ENCODE_BATCH_SIZE = 256
+TRAIN_BATCH_SIZE = 64
+NONSENSE_WORDS = frozenset({"blargle", "fliptop", "monkey", "cheese", "asdf", "lorem", "ipsum"})
+
+
+def _entropy(p: np.ndarray) -> float:
+    """Shannon entropy (nats) of a probability vector."""
+    return float(-np.dot(p, np.log(p + 1e-12)))
+
+
+def _atomic_save(path: Path, write) -> None:
+    """Write a file through a temp file and os.replace() so readers never see a partial one."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class OnnxSentenceEncoder:
+    """
+    ONNX Runtime drop-in for the SentenceTransformer.encode() calls this module
+    makes: mean pooling over the last hidden state, then optional L2 normalization.
+    """
+
+    def __init__(self, onnx_dir: Path, max_length: int = 256):
+        from transformers import AutoTokenizer
+
+        model_path = onnx_dir / "model.onnx"
+        if not model_path.exists():
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+            logger.info(f"Exporting {EMBEDDER_NAME} to ONNX in {onnx_dir}")
+            ORTModelForFeatureExtraction.from_pretrained(EMBEDDER_NAME, export=True).save_pretrained(onnx_dir)
+            AutoTokenizer.from_pretrained(EMBEDDER_NAME).save_pretrained(onnx_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        self.max_length = max_length
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False, device: str = None) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="np")
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, feed)[0]
+            mask = encoded["attention_mask"].astype(np.float32)
+            pooled = np.einsum("bth,bt->bh", token_embeddings, mask) / np.clip(mask.sum(axis=1, keepdims=True), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32, copy=False))
+        return np.concatenate(batches) if batches else np.empty((0, 384), dtype=np.float32)
+
 
 class CalibratedSoftmax(nn.Module):
     def __init__(self, temperature: float = 1.5):
@@ -58,16 +134,118 @@ class IntentClassifier:
     """
 
     _lock = threading.Lock()
+    _shared_embedder = None  # Loaded once per process, shared by every instance
+    _shared_embedder_lock = threading.Lock()
 
     def __init__(self, confidence_threshold: float = 0.6):
         self.confidence_threshold = confidence_threshold
         self.intents = self._load_intents_config()
+        # One alternation per intent: a hit means some keyword is a substring of
+        # the query, which is exactly when RapidFuzz's partial_ratio scores 100
+        self._kw_regex = {
+            intent: re.compile("|".join(map(re.escape, sorted(keywords, key=len, reverse=True))))
+            for intent, keywords in self.intents.items() if keywords
+        }
+        self._kw_flat = [(intent, kw) for intent, keywords in self.intents.items() for kw in keywords]
+        self._kw_choices = [kw for _, kw in self._kw_flat]
         self.encoder = LabelEncoder()
-        self.embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        with IntentClassifier._shared_embedder_lock:
+            if IntentClassifier._shared_embedder is None:
+                IntentClassifier._shared_embedder = self._load_embedder()
+        self.embedder = IntentClassifier._shared_embedder
         self.model = None
         self.model_input_dim = 384
+        self._infer_model = None  # Scripted copy of the head that classify() runs
+        self._infer_buf = torch.empty((1, self.model_input_dim), dtype=torch.float32, device=device)
+        self._infer_lock = threading.Lock()
+        # Per-instance memo tables. Embeddings depend only on the fixed
+        # MiniLM encoder; predictions are rebuilt whenever the head is retrained.
+        self._embed_cached = lru_cache(maxsize=CLASSIFY_CACHE_SIZE)(self._embed)
+        self._reset_prediction_cache()
+        self._retrain_q: "queue.Queue[None]" = queue.Queue()
+        self._retrain_worker = None  # Started on the first update_model() call
         self._load_or_train_model()
 
+    @staticmethod
+    def _load_embedder():
+        # ONNX Runtime's CPU kernels beat eager PyTorch for MiniLM; GPUs keep the
+        # SentenceTransformer in FP16
+        if device.type == "cpu" and ort is not None:
+            try:
+                embedder = OnnxSentenceEncoder(EMBEDDER_ONNX_DIR)
+                logger.info(f"Loaded ONNX Runtime intent embedder from {EMBEDDER_ONNX_DIR}")
+                return embedder
+            except Exception as e:
+                logger.warning(f"ONNX intent embedder unavailable, using SentenceTransformer: {e}")
+
+        from sentence_transformers import SentenceTransformer  # Heavy; only needed without ONNX
+
+        embedder = SentenceTransformer(EMBEDDER_NAME)
+        if device.type == "cuda":
+            embedder.half()
+        return embedder
+
+    def _reset_prediction_cache(self):
+        self._predict_cached = lru_cache(maxsize=CLASSIFY_CACHE_SIZE)(self._predict)
+
+    def _embed(self, text: str) -> np.ndarray:
+        embedding = self.embedder.encode([text], convert_to_numpy=True, normalize_embeddings=True)[0].astype(np.float32, copy=False)
+        return embedding
+
+    def _encode_training(self, texts: List[str]) -> np.ndarray:
+        # Large batches for (re)training; FP16 outputs on GPU are widened for the head
+        embeddings = self.embedder.encode(texts, batch_size=TRAIN_ENCODE_BATCH_SIZE, convert_to_numpy=True,
+                                          normalize_embeddings=True, show_progress_bar=False, device=str(device))
+        return embeddings.astype(np.float32, copy=False)
+
+    def _training_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeddings for the persisted training set. Rows already cached on disk
+        are reused and only samples appended since the last call are encoded.
+        The cache is rebuilt if it has more rows than the training file (e.g.
+        the file was replaced).
+        """
+        cached = None
+        if TRAINING_EMBEDDINGS_PATH.exists():
+            try:
+                cached = np.load(TRAINING_EMBEDDINGS_PATH)
+                if cached.ndim != 2 or cached.shape[1] != self.model_input_dim or len(cached) > len(texts):
+                    cached = None
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable training embedding cache: {e}")
+                cached = None
+
+        done = 0 if cached is None else len(cached)
+        if done == len(texts):
+            return cached
+
+        new = self._encode_training(texts[done:])
+        embeddings = new if cached is None else np.concatenate([cached, new])
+        try:
+            _atomic_save(TRAINING_EMBEDDINGS_PATH, lambda f: np.save(f, embeddings))
+        except Exception as e:
+            logger.warning(f"Could not persist training embedding cache: {e}")
+        logger.info(f"Encoded {len(new)} new training samples ({done} reused from cache)")
+        return embeddings
+
+    def _predict(self, query_clean: str) -> Tuple[str, float]:
+        embedding = self._embed_cached(query_clean)
+        # Reuse one input buffer instead of building a tensor per call
+        with self._infer_lock, torch.inference_mode():
+            self._infer_buf[0].copy_(torch.from_numpy(embedding))
+            # Head and calibrated softmax run as one scripted graph
+            probs = self._infer_model(self._infer_buf).cpu().numpy()[0]
+            classes = self.encoder.classes_  # Swapped together with the head
+
+        idx = int(np.argmax(probs))
+        pred_intent = classes[idx]
+        confidence = float(probs[idx])
+
+        if confidence < self.confidence_threshold or _entropy(probs) > 1.2:
+            pred_intent, confidence = self._fallback_intent(query_clean)
+
+        return pred_intent, confidence
+
     def _clean_query(self, text: str) -> str:
         text = text.lower().strip()
         text = re.sub(r"[^\w\s]", "", text)
@@ -98,12 +276,11 @@ class IntentClassifier:
         try:
             if MODEL_PATH.exists() and ENCODER_PATH.exists():
                 import joblib
-                self.encoder = joblib.load(ENCODER_PATH)
+                encoder = joblib.load(ENCODER_PATH)
                 state_dict = torch.load(MODEL_PATH, map_location=device)
-                num_classes = len(self.encoder.classes_)
-                self.model = IntentClassifierModel(self.model_input_dim, num_classes).to(device)
-                self.model.load_state_dict(state_dict)
-                self.model.eval()
+                model = IntentClassifierModel(self.model_input_dim, len(encoder.classes_)).to(device)
+                model.load_state_dict(state_dict)
+                self._install_model(encoder, model.eval())
                 logger.info(f"Loaded PyTorch intent classifier model from {MODEL_PATH}")
                 return
         except Exception as e:
@@ -111,6 +288,7 @@ class IntentClassifier:
 
         logger.info("Training intent classifier model from scratch...")
         X, y = self._load_training_data()
+        embeddings = self._training_embeddings(X) if X else None
         if not X:
             X = [
                 "How do I apply for vacation leave?",
@@ -140,22 +318,62 @@ class IntentClassifier:
                 "greeting", "greeting", "greeting", "greeting", "greeting"
             ]
 
-        self.encoder.fit(y)
-        embeddings = self.embedder.encode(X, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
-        labels = self.encoder.transform(y)
-
-        self.model = IntentClassifierModel(self.model_input_dim, len(self.encoder.classes_)).to(device)
-        self._train_model(embeddings, labels)
-        self._save_model()
+        if embeddings is None:
+            embeddings = self._encode_training(X)
+        encoder, model = self._fit_model(embeddings, y)
+        self._save_model(encoder, model)
+        self._install_model(encoder, model)
+
+    def _fit_model(self, embeddings: np.ndarray, y: List[str]) -> Tuple[LabelEncoder, nn.Module]:
+        """Fit a new label encoder and head without touching the live ones."""
+        encoder = LabelEncoder()
+        labels = encoder.fit_transform(y)
+        model = IntentClassifierModel(self.model_input_dim, len(encoder.classes_)).to(device)
+        self._train_model(model, embeddings, labels)
+        return encoder, model
+
+    def _install_model(self, encoder: LabelEncoder, model: nn.Module):
+        """
+        Make a trained encoder and head live. The inference copy is built
+        first; the encoder, head and prediction cache are then swapped together
+        under the inference lock so classify() never mixes old and new.
+        """
+        infer_model = self._prepare_inference_model(model)
+        with self._infer_lock:
+            self.encoder = encoder
+            self.model = model
+            self._infer_model = infer_model
+            self._reset_prediction_cache()
+
+    def _prepare_inference_model(self, model: nn.Module) -> nn.Module:
+        """
+        Script the trained head, fused with its calibrated softmax, with
+        TorchScript for classify(); on CPU its Linear layers are dynamically
+        quantized to INT8. The eager FP32 head is left as is for saving.
+        """
+        head = model.eval()
+        if device.type == "cpu":
+            try:
+                head = torch.quantization.quantize_dynamic(head, {nn.Linear}, dtype=torch.qint8)
+            except Exception as e:
+                logger.warning(f"INT8 quantization of intent head failed, keeping FP32: {e}")
+        model = nn.Sequential(head, CalibratedSoftmax(temperature=CLASSIFY_TEMPERATURE)).eval()
+        try:
+            return torch.jit.script(model)
+        except Exception as e:
+            logger.warning(f"TorchScript scripting of intent head failed, using eager model: {e}")
+            return model
 
     def _load_training_data(self) -> Tuple[List[str], List[str]]:
         X, y = [], []
         if not TRAINING_DATA_PATH.exists():
             return X, y
         try:
-            with open(TRAINING_DATA_PATH, "r", encoding="utf-8") as f:
+            # Binary lines straight into orjson: no text decode or strip() copy per line
+            loads = orjson.loads if orjson is not None else json.loads
+            with open(TRAINING_DATA_PATH, "rb") as f:
                 for line in f:
-                    record = json.loads(line.strip())
+                    record = loads(line)
                     X.append(record["query"])
                     y.append(record["intent"])
             logger.info(f"Loaded {len(X)} training samples from persistent store.")
@@ -163,33 +381,47 @@ class IntentClassifier:
             logger.error(f"Failed to load training data: {e}")
         return X, y
 
-    def _train_model(self, embeddings: np.ndarray, labels: np.ndarray, epochs: int = 20, lr: float = 1e-3):
-        self.model.train()
-        optimizer = torch.optim.Adam(self.model.parameters(), lr=lr)
+    def _train_model(self, model: nn.Module, embeddings: np.ndarray, labels: np.ndarray, epochs: int = 20, lr: float = 1e-3):
+        model.train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=lr)
         loss_fn = nn.CrossEntropyLoss(label_smoothing=0.1)
 
         X_train, X_val, y_train, y_val = train_test_split(embeddings, labels, test_size=0.2, stratify=labels)
 
-        X_train = torch.tensor(X_train, dtype=torch.float32).to(device)
-        y_train = torch.tensor(y_train, dtype=torch.long).to(device)
+        # Mini-batches keep memory flat as update_model grows the training set;
+        # small sets still fit in a single batch per epoch
+        train_loader = DataLoader(
+            TensorDataset(torch.from_numpy(np.ascontiguousarray(X_train, dtype=np.float32)),
+                          torch.from_numpy(np.asarray(y_train, dtype=np.int64))),
+            batch_size=TRAIN_BATCH_SIZE, shuffle=True, pin_memory=device.type == "cuda"
+        )
         X_val = torch.tensor(X_val, dtype=torch.float32).to(device)
         y_val = torch.tensor(y_val, dtype=torch.long).to(device)
+        # BF16 autocast needs no GradScaler, but only Ampere+ GPUs support it
+        use_amp = device.type == "cuda" and torch.cuda.is_bf16_supported()
 
         best_loss = float("inf")
         patience = 3
         patience_counter = 0
 
         for epoch in range(epochs):
-            self.model.train()
-            optimizer.zero_grad()
-            outputs = self.model(X_train)
-            loss = loss_fn(outputs, y_train)
-            loss.backward()
-            optimizer.step()
-
-            self.model.eval()
+            model.train()
+            epoch_loss, seen = 0.0, 0
+            for xb, yb in train_loader:
+                xb = xb.to(device, non_blocking=True)
+                yb = yb.to(device, non_blocking=True)
+                optimizer.zero_grad(set_to_none=True)
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                    loss = loss_fn(model(xb), yb)
+                loss.backward()
+                optimizer.step()
+                epoch_loss += loss.item() * len(yb)
+                seen += len(yb)
+            train_loss = epoch_loss / max(seen, 1)
+
+            model.eval()
             with torch.no_grad():
-                val_outputs = self.model(X_val)
+                val_outputs = model(X_val)
                 val_loss = loss_fn(val_outputs, y_val)
 
             if val_loss < best_loss:
@@ -202,15 +434,17 @@ class IntentClassifier:
                     break
 
             if (epoch + 1) % 5 == 0:
-                logger.info(f"Epoch {epoch+1}/{epochs} - Train Loss: {loss.item():.4f} - Val Loss: {val_loss.item():.4f}")
+                logger.info(f"Epoch {epoch+1}/{epochs} - Train Loss: {train_loss:.4f} - Val Loss: {val_loss.item():.4f}")
 
-        self.model.eval()
+        model.eval()
 
-    def _save_model(self):
+    def _save_model(self, encoder: LabelEncoder, model: nn.Module):
         os.makedirs(MODEL_DIR, exist_ok=True)
-        torch.save(self.model.state_dict(), MODEL_PATH)
         import joblib
-        joblib.dump(self.encoder, ENCODER_PATH)
+        # A crash mid-save leaves the previous files intact instead of a
+        # truncated one that forces a retrain on the next start
+        _atomic_save(MODEL_PATH, lambda f: torch.save(model.state_dict(), f))
+        _atomic_save(ENCODER_PATH, lambda f: joblib.dump(encoder, f))
         logger.info(f"Saved intent classifier model and label encoder.")
 
     def classify(self, query: str) -> Dict[str, Any]:
@@ -219,30 +453,17 @@ class IntentClassifier:
             return self._format_response("general", 0.0, query)
 
         # Reject gibberish or meaningless queries
-        if len(query_clean.split()) < 3 or not re.search(r'[a-zA-Z]', query_clean):
+        tokens = query_clean.split()
+        if len(tokens) < 3 or not re.search(r'[a-zA-Z]', query_clean):
             return self._format_response("general", 0.0, query)
 
         # Filter known junk terms
-        nonsense_words = {"blargle", "fliptop", "monkey", "cheese", "asdf", "lorem", "ipsum"}
-        if any(word in query_clean.lower().split() for word in nonsense_words):
+        if not NONSENSE_WORDS.isdisjoint(tokens):
             return self._format_response("general", 0.0, query)
 
         try:
-            embedding = self.embedder.encode([query_clean], convert_to_numpy=True, normalize_embeddings=True)[0]
-            inputs = torch.tensor(embedding, dtype=torch.float32).unsqueeze(0).to(device)
-
-            with torch.no_grad():
-                outputs = self.model(inputs)
-                calibrator = CalibratedSoftmax(temperature=2.0)  # More cautious softmax
-                probs = calibrator(outputs).cpu().numpy()[0]
-
-            idx = int(np.argmax(probs))
-            pred_intent = self.encoder.inverse_transform([idx])[0]
-            confidence = float(np.max(probs))
-
-            if confidence < self.confidence_threshold or entropy(probs) > 1.2:
-                pred_intent, confidence = self._fallback_intent(query_clean)
-
+            # Repeated queries (greetings, FAQs) skip the embedder and classifier head
+            pred_intent, confidence = self._predict_cached(query_clean)
             return self._format_response(pred_intent, confidence, query)
 
         except Exception as e:
@@ -251,14 +472,18 @@ class IntentClassifier:
 
 
     def _fallback_intent(self, query: str) -> Tuple[str, float]:
+            # Exact keyword hit: the fuzzy scan would score it 100 anyway
+            for intent, kw_regex in self._kw_regex.items():
+                if kw_regex.search(query):
+                    return intent, 1.0
+
             max_score = 0.0
             best_intent = "general"
-            for intent, keywords in self.intents.items():
-                for kw in keywords:
-                    score = fuzz.partial_ratio(query, kw)
-                    if score > max_score:
-                        max_score = score
-                        best_intent = intent
+            # One C-level scan over every keyword; ties keep the first keyword
+            match = process.extractOne(query, self._kw_choices, scorer=fuzz.partial_ratio)
+            if match and match[1] > 0:
+                max_score = match[1]
+                best_intent = self._kw_flat[match[2]][0]
             # Scale RapidFuzz score (0–100) to confidence (0.4–1.0)
             scaled_conf = max(0.4, min(1.0, max_score / 100))
             return best_intent, round(scaled_conf, 3)
@@ -286,10 +511,28 @@ class IntentClassifier:
                 with open(TRAINING_DATA_PATH, "a", encoding="utf-8") as f:
                     f.write(json.dumps(record) + "\n")
             logger.info(f"Appended training data: {record}")
-            threading.Thread(target=self._retrain_model).start()
+            self._schedule_retrain()
         except Exception as e:
             logger.error(f"Failed to update training data: {e}")
 
+    def _schedule_retrain(self):
+        with self._lock:
+            if self._retrain_worker is None:
+                self._retrain_worker = threading.Thread(target=self._retrain_loop, name="intent-retrain", daemon=True)
+                self._retrain_worker.start()
+        self._retrain_q.put(None)
+
+    def _retrain_loop(self):
+        """Single retrain worker: a burst of update_model() calls becomes one retrain."""
+        while True:
+            self._retrain_q.get()
+            while True:
+                try:
+                    self._retrain_q.get_nowait()
+                except queue.Empty:
+                    break
+            self._retrain_model()
+
     def _retrain_model(self):
         with self._lock:
             X, y = self._load_training_data()
@@ -297,13 +540,11 @@ class IntentClassifier:
                 logger.warning("No training data available for retraining.")
                 return
             try:
-                embeddings = self.embedder.encode(X, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
-                self.encoder.fit(y)
-                labels = self.encoder.transform(y)
-
-                self.model = IntentClassifierModel(self.model_input_dim, len(self.encoder.classes_)).to(device)
-                self._train_model(embeddings, labels)
-                self._save_model()
+                embeddings = self._training_embeddings(X)
+                # Built off to the side; classify() keeps the old head until the swap
+                encoder, model = self._fit_model(embeddings, y)
+                self._save_model(encoder, model)
+                self._install_model(encoder, model)
                 logger.info(f"Retrained intent classifier with {len(X)} samples.")
             except Exception as e:
                 logger.error(f"Error during retraining: {e}")
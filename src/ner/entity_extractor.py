@@ -10,25 +10,133 @@ Includes:
 - Model versioning on save with timestamp
 """
 
-import spacy
-from spacy.tokens import DocBin
-from spacy.training import Example
+from __future__ import annotations
+
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple, Union
+import asyncio
 import logging
 import json
+import os
+import random
 import time
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+import threading
+
+import numpy as np
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 from ..utils.logger import get_logger
-from ..config import DATA_DIR
+from ..config import (
+    DATA_DIR, NER_TRANSFORMER_MODEL, NER_TRANSFORMER_BACKEND, NER_ONNX_THREADS, USE_INT8_NER, NER_ASYNC_WORKERS
+)
+
+if TYPE_CHECKING:
+    import spacy  # Imported lazily at runtime; loading it is costly
 
 logger = get_logger(__name__)
 
+# Pipelines shared by every EntityExtractor in the process,
+# keyed by (model_dir, transformer_model)
+_NLP_CACHE: Dict[Tuple[str, str], "spacy.Language"] = {}
+_NLP_CACHE_LOCK = threading.Lock()
+_ASYNC_EXECUTOR: Optional[ThreadPoolExecutor] = None  # Created on first aextract_entities() call
+
+
+def _async_executor() -> ThreadPoolExecutor:
+    global _ASYNC_EXECUTOR
+    with _NLP_CACHE_LOCK:
+        if _ASYNC_EXECUTOR is None:
+            _ASYNC_EXECUTOR = ThreadPoolExecutor(max_workers=NER_ASYNC_WORKERS, thread_name_prefix="ner")
+        return _ASYNC_EXECUTOR
+
+
+def _patterns_key(patterns: Dict[str, List[str]]) -> Tuple:
+    return tuple((label, tuple(keywords)) for label, keywords in patterns.items())
+
+
+@lru_cache(maxsize=32)
+def _compile_fallback_regex(patterns_key: Tuple) -> Tuple[re.Pattern, List[str]]:
+    """
+    One alternation over every label, one capturing group per label, so a
+    single finditer pass finds all keyword hits. Returns the pattern and
+    the labels in group order (group i + 1 is labels[i]).
+    """
+    labels = [label for label, keywords in patterns_key if keywords]
+    groups = ['(' + '|'.join(re.escape(k) for k in keywords) + ')' for _, keywords in patterns_key if keywords]
+    pattern = r'\b(?:' + '|'.join(groups) + r')\b'
+    return re.compile(pattern, flags=re.IGNORECASE), labels
+
+
+class _EntityBuffer:
+    """
+    Candidate entity spans for one text, stored column-wise. Overlap filtering
+    runs on the start/end arrays; dicts are only built for the survivors.
+    """
+
+    __slots__ = ("starts", "ends", "labels", "confidences")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.labels: List[str] = []
+        self.confidences: List[float] = []
+
+    def add(self, start: int, end: int, label: str, confidence: float):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.labels.append(label)
+        self.confidences.append(confidence)
+
+    def select(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Resolve overlaps and materialize the surviving entities. Spans are
+        ordered by start, longer first; a span that overlaps the last kept one
+        replaces it only if it is longer.
+        """
+        if not self.starts:
+            return []
+        starts = np.asarray(self.starts, dtype=np.int64)
+        ends = np.asarray(self.ends, dtype=np.int64)
+        order = np.lexsort((starts - ends, starts))  # Stable, like sorted()
+
+        # Kept spans are disjoint and sorted, so the last one holds the max end so far
+        kept: List[int] = []
+        last_end = last_len = -1
+        for i, start, end in zip(order.tolist(), starts[order].tolist(), ends[order].tolist()):
+            if start >= last_end:
+                kept.append(i)
+            elif end - start > last_len:
+                kept[-1] = i  # Keep the longer entity span
+            else:
+                continue
+            last_end, last_len = end, end - start
+
+        return [{
+            "text": text[self.starts[i]:self.ends[i]],
+            "label": self.labels[i],
+            "start": self.starts[i],
+            "end": self.ends[i],
+            "confidence": self.confidences[i],
+        } for i in kept]
+
+
 class EntityExtractor:
     MAX_TEXT_LENGTH = 5000  # max chars to process
-    BATCH_SIZE = 8          # batch size for inference
+    BATCH_SIZE = 32         # batch size for inference
+    MIN_TEXTS_PER_PROCESS = 64  # only fan out to worker processes for larger inputs
+    FAST_PATH_MAX_WORDS = 16    # short texts...
+    FAST_PATH_MIN_HITS = 2      # ...with this many keyword hits skip the model
+    RESULT_CACHE_SIZE = 4096    # per-text results kept in the LRU
+    _model_generation = 0       # bumped on any model/pattern change; pipelines are shared
 
     DEFAULT_PATTERNS = {
         "POLICY": ["policy", "guideline", "procedure", "rule"],
@@ -44,28 +152,56 @@ class EntityExtractor:
         self,
         model_dir: Optional[Path] = None,
         patterns: Optional[Dict[str, List[str]]] = None,
-        transformer_model: str = "distilbert-base-uncased",
+        transformer_model: str = NER_TRANSFORMER_MODEL,
         enable_fallback: bool = True,
+        batch_size: Optional[int] = None,
+        n_process: int = 1,
+        fast_path: bool = True,
     ):
         self.model_dir = model_dir or (DATA_DIR / "models" / "ner_model")
         self.patterns = patterns or self.DEFAULT_PATTERNS
         self.transformer_model = transformer_model
         self.enable_fallback = enable_fallback
-        self.nlp = self._load_or_create_model()
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.fast_path = fast_path and enable_fallback  # Needs the fallback regex
+        # Worker processes re-import spaCy and the model; not worth it under spawn (Windows)
+        self.n_process = n_process if os.name != "nt" else 1
+        self._result_cache: "OrderedDict[Any, List[Dict[str, Any]]]" = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+        self._cache_generation = EntityExtractor._model_generation
+        self.nlp = self._get_shared_model()
+        self._inactive_components = self._find_inactive_components(self.nlp)
 
         # Precompile fallback regex patterns for quick matching
         if self.enable_fallback:
             self.fallback_regex = self._compile_fallback_regex(self.patterns)
 
-    def _compile_fallback_regex(self, patterns: Dict[str, List[str]]) -> Dict[str, re.Pattern]:
-        compiled = {}
-        for label, keywords in patterns.items():
-            # Escape keywords and join as regex group with word boundaries
-            pattern = r'\b(?:' + '|'.join(re.escape(k) for k in keywords) + r')\b'
-            compiled[label] = re.compile(pattern, flags=re.IGNORECASE)
-        return compiled
+    def _compile_fallback_regex(self, patterns: Dict[str, List[str]]) -> Tuple[re.Pattern, List[str]]:
+        return _compile_fallback_regex(_patterns_key(patterns))
+
+    def _get_shared_model(self) -> spacy.Language:
+        """Load (or build) the pipeline once per process and reuse it across instances."""
+        key = (str(self.model_dir), self.transformer_model)
+        with _NLP_CACHE_LOCK:
+            nlp = _NLP_CACHE.get(key)
+            if nlp is None:
+                nlp = self._load_or_create_model()
+                # extract_entities disables a transformer nothing listens to,
+                # so exporting or quantizing it would only slow down loading
+                if "transformer" in self._find_inactive_components(nlp):
+                    if NER_TRANSFORMER_BACKEND == "onnx" or USE_INT8_NER:
+                        logger.warning("NER transformer has no listeners and is skipped during extraction; "
+                                       "NER_TRANSFORMER_BACKEND=onnx / USE_INT8_NER have no effect")
+                elif NER_TRANSFORMER_BACKEND == "onnx":
+                    self._enable_onnx_transformer(nlp)
+                elif USE_INT8_NER:
+                    self._enable_int8_transformer(nlp)
+                _NLP_CACHE[key] = nlp
+        return nlp
 
     def _load_or_create_model(self) -> spacy.Language:
+        import spacy
+
         try:
             if self.model_dir.exists():
                 nlp = spacy.load(self.model_dir)
@@ -100,10 +236,152 @@ class EntityExtractor:
 
         return nlp
 
+    @staticmethod
+    def _find_inactive_components(nlp: spacy.Language) -> List[str]:
+        """
+        Pipes whose output nothing reads: a transformer without listeners only
+        fills doc._.trf_data, which extract_entities never uses.
+        """
+        inactive = []
+        if "transformer" in nlp.pipe_names and not getattr(nlp.get_pipe("transformer"), "listeners", None):
+            inactive.append("transformer")
+        if inactive:
+            logger.info(f"Skipping unused pipeline components during extraction: {inactive}")
+        return inactive
+
+    @staticmethod
+    def _get_hf_model(nlp: spacy.Language):
+        """The Hugging Face torch module behind the spaCy transformer pipe, or None."""
+        if "transformer" not in nlp.pipe_names:
+            return None
+        try:
+            return nlp.get_pipe("transformer").model.transformer
+        except Exception:
+            return None
+
+    def _enable_onnx_transformer(self, nlp: spacy.Language):
+        """
+        Route the transformer pipe's forward passes through ONNX Runtime.
+
+        The model is exported once and cached next to the spaCy model. Only the
+        module's forward is replaced, so its weights (and nlp.to_disk) are
+        untouched. Falls back to PyTorch if onnxruntime or the export fails.
+        """
+        hf_model = self._get_hf_model(nlp)
+        if hf_model is None:
+            logger.warning("No initialized transformer found; ONNX backend not enabled")
+            return
+        try:
+            import onnxruntime as ort
+            import torch
+            from transformers.modeling_outputs import BaseModelOutput
+
+            onnx_path = self._export_onnx_transformer(hf_model)
+            if USE_INT8_NER:
+                onnx_path = self._quantize_onnx_transformer(onnx_path)
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = NER_ONNX_THREADS
+            session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        except Exception as e:
+            logger.warning(f"ONNX Runtime NER transformer unavailable, using PyTorch: {e}")
+            return
+
+        torch_forward = hf_model.forward
+
+        def onnx_forward(input_ids=None, attention_mask=None, **kwargs):
+            # Hidden states/attentions are not exported; defer to PyTorch for those
+            if kwargs.get("output_hidden_states") or kwargs.get("output_attentions") or input_ids is None:
+                return torch_forward(input_ids=input_ids, attention_mask=attention_mask, **kwargs)
+            if attention_mask is None:
+                attention_mask = torch.ones_like(input_ids)
+            last_hidden_state = session.run(None, {
+                "input_ids": input_ids.cpu().numpy().astype("int64"),
+                "attention_mask": attention_mask.cpu().numpy().astype("int64"),
+            })[0]
+            return BaseModelOutput(last_hidden_state=torch.from_numpy(last_hidden_state).to(input_ids.device))
+
+        hf_model.forward = onnx_forward
+        logger.info(f"NER transformer running on ONNX Runtime from {onnx_path}")
+
+    def _enable_int8_transformer(self, nlp: spacy.Language):
+        """
+        Route the transformer pipe's forward passes through a dynamically
+        INT8-quantized copy of its Linear layers. The FP32 module keeps its
+        weights, so saving the pipeline still writes the original model.
+        """
+        hf_model = self._get_hf_model(nlp)
+        if hf_model is None:
+            logger.warning("No initialized transformer found; INT8 quantization not enabled")
+            return
+        try:
+            import torch
+
+            quantized = torch.quantization.quantize_dynamic(hf_model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        except Exception as e:
+            logger.warning(f"INT8 quantization of NER transformer failed, keeping FP32: {e}")
+            return
+        hf_model.forward = quantized.forward
+        logger.info(f"Quantized NER transformer Linear layers to INT8 ({torch.backends.quantized.engine})")
+
+    @staticmethod
+    def _quantize_onnx_transformer(onnx_path: Path) -> Path:
+        int8_path = onnx_path.with_name("transformer_int8.onnx")
+        if not int8_path.exists():
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QInt8)
+            logger.info(f"Quantized ONNX NER transformer to INT8 at {int8_path}")
+        return int8_path
+
+    def _export_onnx_transformer(self, hf_model) -> Path:
+        import torch
+
+        onnx_dir = self.model_dir.parent / f"{self.model_dir.name}_onnx"
+        onnx_path = onnx_dir / "transformer.onnx"
+        if onnx_path.exists():
+            return onnx_path
+
+        onnx_dir.mkdir(parents=True, exist_ok=True)
+        raw_path = onnx_dir / "transformer_raw.onnx"
+        dummy = torch.ones((1, 8), dtype=torch.long)
+        hf_model.eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                hf_model, (dummy, dummy), str(raw_path),
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=14,
+            )
+
+        try:
+            from onnxruntime.transformers.optimizer import optimize_model
+
+            config = hf_model.config
+            optimized = optimize_model(
+                str(raw_path), model_type="bert",
+                num_heads=getattr(config, "n_heads", getattr(config, "num_attention_heads", 0)),
+                hidden_size=getattr(config, "dim", getattr(config, "hidden_size", 0)),
+            )
+            optimized.save_model_to_file(str(onnx_path))
+            raw_path.unlink()
+        except Exception as e:
+            logger.warning(f"ONNX transformer graph optimization failed, using the plain export: {e}")
+            raw_path.replace(onnx_path)
+
+        logger.info(f"Exported NER transformer to {onnx_path}")
+        return onnx_path
+
     def _build_patterns(self) -> List[Dict[str, Any]]:
         return [{"label": label, "pattern": keyword} for label, keywords in self.patterns.items() for keyword in keywords]
 
     def _save_model(self, nlp: spacy.Language):
+        self.clear_cache()  # Model or patterns changed; memoized results are stale
         try:
             self.model_dir.parent.mkdir(parents=True, exist_ok=True)
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
@@ -142,99 +420,163 @@ class EntityExtractor:
             texts = [texts]
             single_input = True
 
-        results = []
         batch_start_time = time.time()
 
-        for i in range(0, len(texts), self.BATCH_SIZE):
-            batch_texts = texts[i : i + self.BATCH_SIZE]
-            # Input validation: truncate overly long inputs
-            batch_texts = [t[: self.MAX_TEXT_LENGTH] if len(t) > self.MAX_TEXT_LENGTH else t for t in batch_texts]
-
-            docs = list(self.nlp.pipe(batch_texts))
-            for doc in docs:
-                entities = []
-
-                # Extract from NER
-                for ent in doc.ents:
-                    entities.append({
-                        "text": ent.text,
-                        "label": ent.label_,
-                        "start": ent.start_char,
-                        "end": ent.end_char,
-                        "confidence": self._estimate_confidence(ent),
-                    })
-
-                # Extract from span categorizer
-                if "sc_spans" in doc.spans:
-                    for span in doc.spans["sc_spans"]:
-                        entities.append({
-                            "text": span.text,
-                            "label": span.label_,
-                            "start": span.start_char,
-                            "end": span.end_char,
-                            "confidence": 1.0,
-                        })
-
-                # Apply fallback regex matches if enabled
-                if self.enable_fallback:
-                    fallback_ents = self._fallback_match(doc.text, existing_entities=entities)
-                    entities.extend(fallback_ents)
-
-                filtered = self._filter_overlapping_entities(entities)
-                results.append(filtered)
+        # Input validation: truncate overly long inputs
+        texts = [self._truncate(t) if len(t) > self.MAX_TEXT_LENGTH else t for t in texts]
+
+        # Repeated texts come straight from the LRU
+        keys = [self._cache_key(t) for t in texts]
+        generation = EntityExtractor._model_generation
+        results = self._cache_lookup(keys)
+        missing = [i for i, r in enumerate(results) if r is None]
+
+        # Short texts the keyword rules already cover never reach the model
+        if self.fast_path:
+            for i in missing:
+                results[i] = self._fast_path_entities(texts[i])
+        slow = [i for i in missing if results[i] is None]
+
+        # One pipe() call so spaCy does the batching (and multiprocessing for big inputs)
+        pipe_kwargs = {"batch_size": self.batch_size, "disable": self._inactive_components}
+        if self.n_process > 1 and len(slow) >= self.MIN_TEXTS_PER_PROCESS:
+            pipe_kwargs["n_process"] = self.n_process
+
+        # Feed texts shortest first so each batch pads to similar lengths;
+        # results land back at their original index
+        slow.sort(key=lambda i: len(texts[i]))
+        for i, doc in zip(slow, self.nlp.pipe([texts[i] for i in slow], **pipe_kwargs)):
+            results[i] = self._doc_entities(doc)
+
+        self._cache_store([(keys[i], results[i]) for i in missing], generation)
 
         total_time = time.time() - batch_start_time
         logger.info(f"Processed {len(texts)} texts in {total_time:.3f}s, avg {total_time/len(texts):.3f}s per text")
         entity_count = sum(len(r) for r in results)
         logger.info(f"Extracted total {entity_count} entities across batch")
 
+        # Hand out copies so callers cannot mutate cached entries
+        results = [[dict(ent) for ent in r] for r in results]
         return results[0] if single_input else results
 
-    def _fallback_match(self, text: str, existing_entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def aextract_entities(
+        self, texts: Union[str, List[str]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Async variant of extract_entities for the chat path. Batches run on a
+        shared worker pool (NER_ASYNC_WORKERS threads), so the event loop stays
+        free for retrieval and LLM I/O. Same inputs and return shape.
+        """
+        single_input = isinstance(texts, str)
+        texts = [texts] if single_input else list(texts)
+
+        loop = asyncio.get_running_loop()
+        executor = _async_executor()
+        batches = [texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(executor, self.extract_entities, batch) for batch in batches
+        ))
+        results = [entities for part in parts for entities in part]
+        return results[0] if single_input else results
+
+    def _truncate(self, text: str) -> str:
+        """Cut to MAX_TEXT_LENGTH, backing up to the last whitespace so no word is split."""
+        limit = self.MAX_TEXT_LENGTH
+        cut = max(text.rfind(" ", limit - 100, limit + 1), text.rfind("\n", limit - 100, limit + 1))
+        return text[:cut] if cut > 0 else text[:limit]
+
+    @staticmethod
+    def _cache_key(text: str):
+        # 64-bit xxh3 keeps keys small; fall back to the text itself
+        return xxhash.xxh3_64_intdigest(text) if xxhash is not None else text
+
+    def _sync_cache_generation(self):
+        # Another instance may have changed the shared pipeline; caller holds the lock
+        if self._cache_generation != EntityExtractor._model_generation:
+            self._result_cache.clear()
+            self._cache_generation = EntityExtractor._model_generation
+
+    def _cache_lookup(self, keys: List[Any]) -> List[Optional[List[Dict[str, Any]]]]:
+        found = []
+        with self._result_cache_lock:
+            self._sync_cache_generation()
+            for key in keys:
+                entry = self._result_cache.get(key)
+                if entry is not None:
+                    self._result_cache.move_to_end(key)
+                found.append(entry)
+        return found
+
+    def _cache_store(self, items: List[Tuple[Any, List[Dict[str, Any]]]], generation: int):
+        with self._result_cache_lock:
+            self._sync_cache_generation()
+            if generation != self._cache_generation:
+                return  # Computed against a pipeline that has since changed
+            for key, entities in items:
+                self._result_cache[key] = entities
+                self._result_cache.move_to_end(key)
+            while len(self._result_cache) > self.RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+
+    def clear_cache(self):
+        """
+        Drop memoized results; called whenever the model or patterns change.
+        Other instances sharing the pipeline drop theirs on their next call.
+        """
+        with _NLP_CACHE_LOCK:
+            EntityExtractor._model_generation += 1
+        with self._result_cache_lock:
+            self._sync_cache_generation()
+
+    def _fast_path_entities(self, text: str) -> Optional[List[Dict[str, Any]]]:
+        """Rule-only entities for a short, keyword-dense text, or None if it needs the model."""
+        if len(text.split(None, self.FAST_PATH_MAX_WORDS)) > self.FAST_PATH_MAX_WORDS:
+            return None
+        candidates = _EntityBuffer()
+        if self._fallback_match(text, candidates, confidence=0.9) < self.FAST_PATH_MIN_HITS:
+            return None
+        return candidates.select(text)
+
+    def _doc_entities(self, doc) -> List[Dict[str, Any]]:
+        """Entity dicts for one processed Doc: model entities, spans, then fallback hits."""
+        candidates = _EntityBuffer()
+
+        # Extract from NER
+        for ent in doc.ents:
+            candidates.add(ent.start_char, ent.end_char, ent.label_, self._estimate_confidence(ent))
+
+        # Extract from span categorizer
+        if "sc_spans" in doc.spans:
+            for span in doc.spans["sc_spans"]:
+                candidates.add(span.start_char, span.end_char, span.label_, 1.0)
+
+        # Apply fallback regex matches if enabled
+        if self.enable_fallback:
+            self._fallback_match(doc.text, candidates)
+
+        return candidates.select(doc.text)
+
+    def _fallback_match(self, text: str, candidates: _EntityBuffer, confidence: float = 0.6) -> int:
         """
         Simple fallback regex matcher for patterns not caught by model.
-        Avoid duplicates by checking overlap with existing_entities.
+        Adds every keyword hit to candidates and returns how many were added;
+        overlaps with model entities are resolved in _EntityBuffer.select().
         """
-        fallback_entities = []
-        occupied = [(e["start"], e["end"]) for e in existing_entities]
-
-        def overlaps(s, e):
-            return any(not (e <= os or s >= oe) for os, oe in occupied)
-
-        for label, regex in self.fallback_regex.items():
-            for match in regex.finditer(text):
-                s, e = match.start(), match.end()
-                if not overlaps(s, e):
-                    fallback_entities.append({
-                        "text": text[s:e],
-                        "label": label,
-                        "start": s,
-                        "end": e,
-                        "confidence": 0.6,  # Lower confidence for fallback
-                    })
-                    occupied.append((s, e))
-        return fallback_entities
-
-    def _filter_overlapping_entities(self, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        if not entities:
-            return []
-        # Sort by start index and longer spans first in case of overlap
-        entities = sorted(entities, key=lambda e: (e["start"], -(e["end"] - e["start"])))
-        filtered = []
-        for ent in entities:
-            if not filtered or ent["start"] >= filtered[-1]["end"]:
-                filtered.append(ent)
-            else:
-                last = filtered[-1]
-                # Keep the longer entity span
-                if (ent["end"] - ent["start"]) > (last["end"] - last["start"]):
-                    filtered[-1] = ent
-        return filtered
+        regex, labels = self.fallback_regex
+        added = 0
+        for match in regex.finditer(text):
+            candidates.add(match.start(), match.end(), labels[match.lastindex - 1], confidence)
+            added += 1
+        return added
 
     def update_model(self, texts: List[str], annotations: List[List[Tuple[int, int, str]]], n_iter: int = 20):
         if not texts or not annotations or len(texts) != len(annotations):
             logger.error("Invalid training data.")
             return
+        from spacy.training import Example
+        from spacy.util import minibatch
+        from thinc.api import compounding
+
         try:
             ner = self.nlp.get_pipe("ner")
             span_cat = self.nlp.get_pipe("span_categorizer", default=None)
@@ -256,12 +598,22 @@ class EntityExtractor:
                 })
                 examples.append(example)
 
+            # Examples (and their Docs) are built once above and reused every epoch;
+            # each epoch shuffles them into minibatches that grow from 4 to 32
+            batch_sizes = compounding(4.0, 32.0, 1.001)
             with self.nlp.select_pipes(enable=["ner", "span_categorizer"]):
                 optimizer = self.nlp.resume_training()
                 for _ in range(n_iter):
-                    self.nlp.update(examples, sgd=optimizer, drop=0.2)
-
-            self._save_model(self.nlp)
+                    random.shuffle(examples)
+                    for batch in minibatch(examples, size=batch_sizes):
+                        self.nlp.update(batch, sgd=optimizer, drop=0.2)
+
+            # Save the averaged weights, which generalize better than the last step's
+            if getattr(optimizer, "averages", None):
+                with self.nlp.use_params(optimizer.averages):
+                    self._save_model(self.nlp)
+            else:
+                self._save_model(self.nlp)
             logger.info("NER and span categorizer updated.")
 
         except Exception as e:
@@ -289,17 +641,29 @@ class EntityExtractor:
                 raise ValueError("Patterns JSON must be a dict.")
             self.patterns = loaded
 
-            if "entity_ruler" in self.nlp.pipe_names:
-                self.nlp.remove_pipe("entity_ruler")
-            ruler = self.nlp.add_pipe("entity_ruler", before="ner")
+            # Swap the ruler's patterns in place; the transformer and other pipes are untouched
+            if "entity_ruler" in self.nlp.pipe_names and hasattr(self.nlp.get_pipe("entity_ruler"), "clear"):
+                ruler = self.nlp.get_pipe("entity_ruler")
+                ruler.clear()
+            else:
+                if "entity_ruler" in self.nlp.pipe_names:
+                    self.nlp.remove_pipe("entity_ruler")
+                ruler = self.nlp.add_pipe("entity_ruler", before="ner")
             ruler.add_patterns(self._build_patterns())
 
-            self._save_model(self.nlp)
-            logger.info(f"Patterns loaded and model updated from {filepath}")
+            if self.enable_fallback:
+                self.fallback_regex = self._compile_fallback_regex(self.patterns)
+            self.clear_cache()
+
+            # Persist just the ruler when a saved pipeline exists; otherwise save it whole
+            if (self.model_dir / "meta.json").exists():
+                ruler.to_disk(self.model_dir / "entity_ruler")
+            else:
+                self._save_model(self.nlp)
+            logger.info(f"Patterns loaded and entity ruler updated from {filepath}")
         except Exception as e:
             logger.error(f"Load error: {e}")
 
-
 if __name__ == "__main__":
     extractor = EntityExtractor()
 
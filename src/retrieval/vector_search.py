@@ -7,6 +7,7 @@ import time
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 
 from ..utils.logger import get_logger
+from ..core.resources import GlobalResources
 from ..database.vector_store import VectorStore
 from ..document_processing.embedding_generator import EmbeddingGenerator
 from ..config import SIMILARITY_THRESHOLD, MAX_VECTOR_SEARCH_TOP_K
@@ -20,7 +21,7 @@ class VectorSearch:
     def __init__(self,
                  vector_store: VectorStore = None,
                  embedding_generator: EmbeddingGenerator = None):
-        self.vector_store = vector_store or VectorStore()
+        self.vector_store = vector_store or GlobalResources.get_vector_store()
         self.embedding_generator = embedding_generator or EmbeddingGenerator()
 
     @retry(stop=stop_after_attempt(3), wait=wait_fixed(1), retry=retry_if_exception_type(Exception))
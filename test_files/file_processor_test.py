@@ -0,0 +1,29 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.document_processing import file_processor
+from src.document_processing.file_processor import FileProcessor
+
+
+def test_txt_extraction_normalizes_line_endings(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes("Fever and cough.\r\nRest and fluids.\rSee a doctor.".encode("utf-8"))
+
+    doc = FileProcessor.process_file(path)
+
+    assert doc["file_type"] == "txt"
+    assert doc["content"] == "Fever and cough.\nRest and fluids.\nSee a doctor."
+
+def test_markdown_extraction_strips_syntax(tmp_path):
+    path = tmp_path / "flu-guide.md"
+    path.write_text("# Flu Guide\n\n- Drink **plenty** of water\n- See [your GP](https://example.org)\n", encoding="utf-8")
+
+    doc = FileProcessor.process_file(path)
+
+    assert doc["title"] == "Flu Guide"
+    assert doc["content"] == "Flu Guide\n\nDrink plenty of water\nSee your GP"
+
+def test_missing_optional_dependency_is_cached_as_none():
+    assert file_processor._lazy("module_that_does_not_exist") is None
+    assert file_processor._OPTIONAL_MODULES["module_that_does_not_exist"] is None
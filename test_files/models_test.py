@@ -0,0 +1,69 @@
+import pytest
+
+import os
+import sqlite3
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database.models import Database, ConversationModel, DocumentModel, VectorIndexModel
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = Database(tmp_path / "test.db")
+    # Models fetch Database.instance() in __init__; keep them off the real data/db file
+    monkeypatch.setattr(Database, "instance", classmethod(lambda cls, db_path=None: database))
+    return database
+
+def test_save_documents_returns_ids_in_order(db):
+    model = DocumentModel()
+    chunks = [
+        {"title": f"Doc - Part {i+1}", "content": f"chunk {i}", "source_file": "doc.txt", "chunk_index": i}
+        for i in range(3)
+    ]
+
+    ids = model.save_documents(chunks)
+
+    assert len(ids) == 3
+    assert [model.get_document(i)["content"] for i in ids] == ["chunk 0", "chunk 1", "chunk 2"]
+    assert [d["chunk_index"] for d in model.get_documents_by_source("doc.txt")] == [0, 1, 2]
+
+def test_save_index_metadata_upserts(db):
+    model = VectorIndexModel()
+
+    first_id = model.save_index_metadata("main", 768, 10)
+    second_id = model.save_index_metadata("main", 768, 25)
+
+    assert first_id == second_id
+    assert model.get_index_metadata("main")["num_vectors"] == 25
+
+def test_conversations_newest_first(db):
+    model = ConversationModel()
+    model.save_conversation("device", "first", "a", "en", 100.0, 101.0)
+    model.save_conversation("device", "second", "b", "en", 200.0, 201.5)
+
+    conversations = model.get_conversations("device")
+
+    assert [c["user_query"] for c in conversations] == ["second", "first"]
+    assert conversations[0]["response_time_seconds"] == 1.5
+    assert model.get_chat_message_count("device") == 2
+
+def test_legacy_iso_timestamps_are_migrated(tmp_path):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT NOT NULL UNIQUE, '
+                 'password_hash TEXT NOT NULL, full_name TEXT NOT NULL, employee_id TEXT UNIQUE, '
+                 'created_at TIMESTAMP NOT NULL, last_login TIMESTAMP)')
+    conn.execute("INSERT INTO users (email, password_hash, full_name, created_at, last_login) "
+                 "VALUES ('a@b.c', 'x', 'A', '2024-05-01T10:00:00', NULL)")
+    conn.execute('PRAGMA user_version = 1')  # Only the conversations columns were converted
+    conn.commit()
+    conn.close()
+
+    Database(path)
+
+    conn = sqlite3.connect(path)
+    created_at, last_login = conn.execute('SELECT created_at, last_login FROM users').fetchone()
+    assert isinstance(created_at, float)
+    assert last_login is None
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 2
@@ -0,0 +1,34 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.document_processing.text_chunker import TextChunker
+
+
+def test_paragraphs_are_packed_and_overlapped():
+    chunker = TextChunker(chunk_size=40, chunk_overlap=5)
+    text = "First   para here.\n\nSecond para.\n\nThird one is a bit longer."
+
+    chunks = chunker._split_text(text)
+
+    assert chunks == [
+        "First para here.\n\nSecond para.",
+        "para.Third one is a bit longer.",
+    ]
+
+def test_oversized_paragraph_is_force_split():
+    chunker = TextChunker(chunk_size=10, chunk_overlap=2, include_overlap_in_chunk=False)
+
+    chunks = chunker._split_text("abcdefghijklmnopqrstuvwxyz")
+
+    assert chunks == ["abcdefghij", "ijklmnopqr", "qrstuvwxyz", "yz"]
+
+def test_chunk_document_metadata():
+    chunker = TextChunker(chunk_size=25, chunk_overlap=0)
+    document = {"title": "Asthma", "content": "Use your inhaler.\n\nAvoid smoke and dust.", "source_file": "asthma.txt"}
+
+    chunks = chunker.chunk_document(document)
+
+    assert [c["title"] for c in chunks] == ["Asthma - Part 1", "Asthma - Part 2"]
+    assert [c["chunk_index"] for c in chunks] == [0, 1]
+    assert all(c["source_file"] == "asthma.txt" for c in chunks)